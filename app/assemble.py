@@ -0,0 +1,258 @@
+"""
+Headless script for assembling templates in batches (no display needed).
+Find patient folders -> Rename their images -> Assemble templates concurrently -> Print a summary.
+Each patient's result is recorded in the journal, so running it again after a failure (or after
+being interrupted) only assembles what is left. With --upload (and/or --remove-background) the
+patients are streamed through a pipeline instead: rename -> remove backgrounds -> assemble ->
+upload, each stage with its own workers (see utilities.pipeline).
+
+Usage (from the project's root folder or from this folder, respectively):
+    python -m app.assemble <root> [--workers N] [--upload] [--remove-background]
+    python assemble.py <root> [--workers N] [--upload] [--remove-background]
+"""
+
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+
+try:
+    from utilities.my_secrets import get_secrets  # type: ignore[import]
+    from utilities.layout import Layout, load_layout  # type: ignore[import]
+    from utilities.scanner import ScanStats  # type: ignore[import]
+    from utilities import bg_model, journal, pipeline  # type: ignore[import]
+    from utilities import commands, folders, workers  # type: ignore[import]
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from utilities.my_secrets import get_secrets  # type: ignore[import]
+    from utilities.layout import Layout, load_layout  # type: ignore[import]
+    from utilities.scanner import ScanStats  # type: ignore[import]
+    from utilities import bg_model, journal, pipeline  # type: ignore[import]
+    from utilities import commands, folders, workers  # type: ignore[import]
+
+
+def assemble_patient(
+    patient_id: str,
+    path_pasta: str,
+    template: np.ndarray,
+    layout: Layout,
+    fast_decode: bool,
+    jobs: journal.Journal,
+) -> float:
+    """
+    This function will assemble a single patient's template(s) and record the result in jobs. It
+    returns how long it took (in seconds).
+    """
+    start = time.perf_counter()
+    with jobs.stage(
+        path_pasta,
+        patient_id,
+        journal.ASSEMBLED,
+        journal.photos_fingerprint(path_pasta),
+    ):
+        commands.montar_template(patient_id, path_pasta, template, layout, fast_decode)
+    return time.perf_counter() - start
+
+
+def run_pipeline(
+    args: argparse.Namespace,
+    to_assemble: list,
+    template: np.ndarray,
+    layout: Layout,
+) -> int:
+    """
+    This function will stream the patients through the pipeline's stages and print each stage's
+    summary. It returns 1 if any patient failed, 0 otherwise.
+    """
+
+    def show_result(stage: str, _: str, patient_id: str, error: str) -> None:
+        print(f"{patient_id}: {stage} {'FAILED (' + error + ')' if error else 'OK'}")
+
+    stages = pipeline.default_stages(
+        template,
+        layout,
+        args.fast_decode,
+        remove_background=args.remove_background,
+        upload=args.upload,
+        workers={"assemble": args.workers},
+    )
+    print(
+        f"Processing {len(to_assemble)} patient(s): "
+        + " -> ".join(f"{stage.name} ({stage.workers})" for stage in stages)
+    )
+    start = time.perf_counter()
+    try:
+        all_stats = pipeline.run_pipeline(to_assemble, stages, on_result=show_result)
+    finally:
+        workers.shutdown_pool()
+    elapsed = time.perf_counter() - start
+
+    for stats in all_stats:
+        print(stats.report())
+    if args.remove_background:
+        print(bg_model.model_stats().report())
+    done = all_stats[-1].done
+    print(
+        f"Finished {done}/{len(to_assemble)} patient(s) in {elapsed:.2f}s "
+        f"({done / elapsed * 60:.1f} patients/min)."
+    )
+    return 1 if done < len(to_assemble) else 0
+
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    """
+    This function will parse the command line arguments.
+    """
+    secrets = get_secrets()
+    parser = argparse.ArgumentParser(
+        description="Assemble templates for every patient folder inside root."
+    )
+    parser.add_argument(
+        "root",
+        nargs="?",
+        default=secrets["default_path_to_images"],
+        help="Folder with the patient folders (defaults to the app's current folder).",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=secrets.get("assemble_workers", 2),
+        help="Amount of patients assembled at the same time.",
+    )
+    parser.add_argument(
+        "--layout",
+        default=secrets.get("layout", "default"),
+        help="Layout name (a file in the layouts folder) or path to a layout file.",
+    )
+    parser.add_argument(
+        "--fast-decode",
+        action=argparse.BooleanOptionalAction,
+        default=secrets.get("fast_decode", True),
+        help="Decode JPEGs at a reduced resolution (use --no-fast-decode to compare quality).",
+    )
+    parser.add_argument(
+        "--scan-only",
+        action="store_true",
+        help="Only scan root's folders and report how long it took.",
+    )
+    parser.add_argument(
+        "--template",
+        default=None,
+        help="Blank template image (defaults to the layout's background).",
+    )
+    parser.add_argument(
+        "--upload",
+        action="store_true",
+        help="Upload each template as soon as it's assembled (streaming pipeline).",
+    )
+    parser.add_argument(
+        "--remove-background",
+        action="store_true",
+        help="Remove the backgrounds of each folder's photos before assembling it (streaming "
+        "pipeline).",
+    )
+    parser.add_argument(
+        "--show-failed",
+        action="store_true",
+        help="Only list the folders whose last try of some stage failed (per the journal).",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list = None) -> int:
+    """
+    This function will assemble all pending templates and print a per patient summary. It returns
+    1 if any patient failed, 0 otherwise.
+    """
+    args = parse_args(argv)
+    if args.workers < 1:
+        print("--workers should be at least 1.", file=sys.stderr)
+        return 2
+
+    jobs = journal.Journal()
+    if args.show_failed:
+        for stage in (
+            journal.RENAMED,
+            journal.BACKGROUND_REMOVED,
+            journal.ASSEMBLED,
+            journal.UPLOADED,
+        ):
+            for path_pasta, patient_id, error in jobs.failed(stage):
+                print(f"{patient_id} ({stage}): {error} [{path_pasta}]")
+        return 0
+
+    layout = load_layout(args.layout)
+    scan_stats = ScanStats()
+    to_assemble, to_upload = folders.classify_patient_folders(
+        args.root, len(layout.slots), stats=scan_stats
+    )
+    print(scan_stats.report())
+    if args.scan_only:
+        print(f"{len(to_assemble)} folder(s) to assemble, {len(to_upload)} to upload.")
+        return 0
+    if len(to_assemble) == 0:
+        print(
+            f"No folders with {len(layout.slots)} images and no template found in "
+            f"{args.root}"
+        )
+        return 0
+
+    template = commands.load_template(args.template or layout.background)
+    layout.check_canvas(template.shape)
+    if args.upload or args.remove_background:
+        return run_pipeline(args, to_assemble, template, layout)
+    failures = 0
+    rename_errors = folders.rename_all([path_pasta for path_pasta, _ in to_assemble])
+    for path_pasta, patient_id in to_assemble:
+        if path_pasta in rename_errors:
+            failures += 1
+            print(f"{patient_id}: FAILED (rename: {rename_errors[path_pasta]})")
+    renamed = [item for item in to_assemble if item[0] not in rename_errors]
+
+    print(
+        f"Assembling {len(renamed)} template(s) with {args.workers} worker(s) "
+        f"({workers.pool_size()} decoding process(es))..."
+    )
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            futures = {
+                executor.submit(
+                    assemble_patient,
+                    patient_id,
+                    path_pasta,
+                    template,
+                    layout,
+                    args.fast_decode,
+                    jobs,
+                ): patient_id
+                for path_pasta, patient_id in renamed
+            }
+            for future in as_completed(futures):
+                patient_id = futures[future]
+                try:
+                    seconds = future.result()
+                except Exception as err:  # pylint: disable=broad-except
+                    failures += 1
+                    print(f"{patient_id}: FAILED ({type(err).__name__}: {err})")
+                else:
+                    print(f"{patient_id}: OK ({seconds:.2f}s)")
+    finally:
+        workers.shutdown_pool()
+    elapsed = time.perf_counter() - start
+
+    done = len(to_assemble) - failures
+    print(
+        f"Assembled {done}/{len(to_assemble)} template(s) in {elapsed:.2f}s "
+        f"({done / elapsed * 60:.1f} patients/min)."
+    )
+    if (cache := commands.slot_cache()) is not None:
+        print(f"Slot cache: {cache.stats()}")
+    return 1 if failures > 0 else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
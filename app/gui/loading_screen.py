@@ -2,14 +2,19 @@
 This module implements the loading screen class.
 """
 
-from tkinter import Tk, Label
+import time
+from tkinter import Tk, Label, Frame
 from PIL import Image, ImageTk  # type: ignore[import]
 
+PROGRESS_COLOR = "#C2CEFF"
+
 
 class LoadingScreen(Tk):
     """
     This top level will create a loading screen and display it for a given amount of seconds.
-    It can accept a list of threads to wait for before closing itself and showing the main screen.
+    It can accept a list of threads to wait for before closing itself and showing the main screen,
+    or a warm-up (see utilities.startup): its progress is shown and the loading screen closes
+    itself once its required steps are done (and the given amount of seconds passed).
     """
 
     def __init__(
@@ -18,12 +23,15 @@ class LoadingScreen(Tk):
         seconds: float = 0.5,
         image_path: str = "./images/icon.png",
         wait_for: list = None,
+        warm_up=None,
     ):
         super().__init__()
         self.seconds: float = seconds
         self.image_path: str = image_path
 
         self.wait_for: list = wait_for if wait_for is not None else []
+        self.warm_up = warm_up
+        self.shown_at: float = 0.0
 
         self.logo = Image.open(self.image_path)
         self.logo_tk = ImageTk.PhotoImage(self.logo)
@@ -34,6 +42,12 @@ class LoadingScreen(Tk):
     def _draw_window(self) -> None:
         label = Label(self, image=self.logo_tk, bg="black")
         label.place(x=0, y=0)
+        if self.warm_up is not None:
+            self.progress_bar = Frame(self, bg=PROGRESS_COLOR, height=4)
+            self.progress_text = Label(
+                self, bg="black", fg=PROGRESS_COLOR, font=("Arial", 9)
+            )
+            self.progress_text.place(relx=0.5, rely=1.0, y=-8, anchor="s")
 
         self.withdraw()
         self.geometry(f"{self.logo.size[0]}x{self.logo.size[1]}")
@@ -53,12 +67,31 @@ class LoadingScreen(Tk):
 
         self.lift()
         self.deiconify()
+        self.shown_at = time.perf_counter()
+        if self.warm_up is not None:
+            self.warm_up.mark("loading screen")
 
     def _wait(self) -> None:
         for thread in self.wait_for:
             self.after(int(self.seconds * 1000) + 50, thread.join)
 
-        self.after(int(self.seconds * 1000) + 200, self.destroy)
+        if self.warm_up is None:
+            self.after(int(self.seconds * 1000) + 200, self.destroy)
+        else:
+            self.after(50, self._show_progress)
+
+    def _show_progress(self) -> None:
+        done, total, current = self.warm_up.progress()
+        if done > 0:
+            self.progress_bar.place(x=0, rely=1.0, anchor="sw", relwidth=done / total)
+        self.progress_text.configure(
+            text=f"Carregando {current}... ({done + 1}/{total})" if current else ""
+        )  # Loading
+
+        if self.warm_up.ready() and time.perf_counter() - self.shown_at >= self.seconds:
+            self.destroy()
+        else:
+            self.after(50, self._show_progress)
 
 
 def main() -> int:
@@ -6,26 +6,31 @@ import os
 import json
 import tkinter as tk
 from tkinter import filedialog, messagebox
-from glob import glob
-import numpy as np
-from PIL import Image  # type: ignore[import]
 import customtkinter as ctk  # type: ignore[import]
 
 try:
     from utilities.im_processing import load_img  # type: ignore[import]
-    from utilities.im_bg import rm_bg, rm_bg_from_folder, imp_th  # type: ignore[import]
+    from utilities.im_bg import rm_bg, rm_bg_from_folder  # type: ignore[import]
     from utilities.paths import join_pr  # type: ignore[import]
     from utilities.my_secrets import get_secrets  # type: ignore[import]
-    from utilities import commands  # type: ignore[import]
+    from utilities.layout import load_layout  # type: ignore[import]
+    from utilities.watcher import FolderWatcher  # type: ignore[import]
+    from utilities.scanner import ScanStats  # type: ignore[import]
+    from utilities import bg_model, commands, folders, journal, uploader  # type: ignore[import]
+    from gui.top_levels.template_preview import TemplatePreview  # type: ignore[import]
 except ImportError:
     import sys
 
     sys.path.insert(0, os.path.abspath(".."))
     from utilities.im_processing import load_img  # type: ignore[import]
-    from utilities.im_bg import rm_bg, rm_bg_from_folder, imp_th  # type: ignore[import]
+    from utilities.im_bg import rm_bg, rm_bg_from_folder  # type: ignore[import]
     from utilities.paths import join_pr  # type: ignore[import]
     from utilities.my_secrets import get_secrets  # type: ignore[import]
-    from utilities import commands  # type: ignore[import]
+    from utilities.layout import load_layout  # type: ignore[import]
+    from utilities.watcher import FolderWatcher  # type: ignore[import]
+    from utilities.scanner import ScanStats  # type: ignore[import]
+    from utilities import bg_model, commands, folders, journal, uploader  # type: ignore[import]
+    from gui.top_levels.template_preview import TemplatePreview  # type: ignore[import]
 
 ctk.set_appearance_mode("dark")
 ctk.set_default_color_theme("dark-blue")
@@ -52,9 +57,12 @@ class MainWindow(ctk.CTk):
 
         self.paths_e_ids_pastas_8_imagens = []
         self.paths_e_ids_pastas_8_imagens_para_upload = []
-        self.template = np.array(
-            Image.open(join_pr("images", "templates", "template.jpg"))
-        )
+        self.busy = False
+        self.watcher = None
+        self.scan_stats = None
+        self.rename_stats = None
+        self.preview_window = None
+        self.layout = load_layout(get_secrets().get("layout", "default"))
 
         self._load_window()
 
@@ -76,6 +84,7 @@ class MainWindow(ctk.CTk):
         """
         self._check_and_load_secrets()
         self.refresh_paths_list()
+        self._start_watcher()
 
         self.images["icon"] = load_img(join_pr("images", "icon.png"), (30, 30))
         self.images["upload"] = load_img(join_pr("images", "upload.png"), (40, 40))
@@ -312,9 +321,16 @@ class MainWindow(ctk.CTk):
     def _path_anchor(self) -> str:
         return "center" if len(self.vars["folder_path"].get()) <= 85 else "w"
 
+    @property
+    def template(self):
+        """
+        The layout's blank template (read-only, see commands.load_template).
+        """
+        return commands.load_template(self.layout.background)
+
     def remove_background_button_press(
         self,
-        model_name: str = "u2net_human_seg",
+        model_name: str | None = None,
         alpha_matting: bool = False,
     ) -> None:
         """
@@ -339,12 +355,16 @@ class MainWindow(ctk.CTk):
         if len(selected_files) == 0:
             return
 
-        for img_file_path in selected_files:
-            rm_bg(
-                img_file_path,
-                model_name=model_name,
-                alpha_matting=alpha_matting,
-            )
+        try:
+            for img_file_path in selected_files:
+                rm_bg(
+                    img_file_path,
+                    model_name=model_name,
+                    alpha_matting=alpha_matting,
+                )
+        finally:
+            # The model's loading vs. inference times.
+            print(bg_model.model_stats(model_name).report())
 
         messagebox.showinfo(
             # Finished
@@ -365,7 +385,11 @@ class MainWindow(ctk.CTk):
         - Images should start with numbers 1 to 3;
         - They shouldn't end in "G" (e.g. 1_IMG will be read but 1_IMG_NO_BG.jpg won't);
         """
-        rm_bg_from_folder(self.secrets["default_path_to_images"])
+        try:
+            rm_bg_from_folder(self.secrets["default_path_to_images"])
+        finally:
+            # The model's loading vs. inference times.
+            print(bg_model.model_stats().report())
 
         messagebox.showinfo(
             # Finished
@@ -401,104 +425,218 @@ class MainWindow(ctk.CTk):
         self.vars["folder_path"].set(selected_folder)
         self.widgets["lbl_folder_path"].configure(anchor=self._path_anchor)
         self.check_folders()
+        self._start_watcher()
+
+    def _start_watcher(self) -> None:
+        """
+        If "watch_folders" is enabled (secrets file), this function will (re)start watching the
+        current folder, so the lists of folders to process/upload are kept up to date. If
+        "auto_assemble" is also enabled, folders that become ready are assembled automatically.
+        """
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+        if not self.secrets.get("watch_folders", False):
+            return
+
+        self.watcher = FolderWatcher(
+            self.secrets["default_path_to_images"],
+            # Called from the watcher's thread, so the share is never listed from Tk's thread.
+            self._on_folders_changed,
+            settle=self.secrets.get("watch_settle_seconds", 2),
+        )
+        self.watcher.start()
+
+    def _on_folders_changed(self, paths: set) -> None:
+        """
+        This function will update the lists of folders to process/upload with the folders a
+        watcher reported as changed (it runs in the watcher's thread, the labels are updated by
+        Tk's thread). Nothing happens while a batch is running (lists are refreshed when it
+        finishes).
+        """
+        if self.busy:
+            return
+
+        ready_before = set(self.paths_e_ids_pastas_8_imagens)
+        self.refresh_paths_list(paths)
+        # Tkinter should only be touched from its own thread.
+        self.after(0, self.update_folder_labels)
+
+        newly_ready = set(self.paths_e_ids_pastas_8_imagens) - ready_before
+        if newly_ready and self.secrets.get("auto_assemble", False):
+            self.busy = True
+            commands.background(self.assemble_all_templates)
 
     ##########################################################################################
     ##########################################################################################
     ##########################################################################################
     ##########################################################################################
 
-    def refresh_paths_list(self):
-        def renomear_imagens(path):
-            # clearCMD()
-            # print(f'Renomeando imagens da pasta {path_e_id[1]}')
-
-            for number, image_path in enumerate(glob(path + "\\*MG*.jpg")):
-                split_image_path = image_path.split("\\")
-                if split_image_path[-1][0] not in "0123456789":
-                    split_image_path[-1] = str(number + 1) + "_" + split_image_path[-1]
-                    os.rename(image_path, "\\".join(split_image_path))
-
-            objetiva = path + "\\OBJETIVA"
-            if os.path.exists(objetiva):
-                renomear_imagens(objetiva)
-
-        self.paths_e_ids_pastas_8_imagens = []
-        self.paths_e_ids_pastas_8_imagens_para_upload = []
-        if os.path.exists(self.secrets["default_path_to_images"]):
-            path_pastas_pacientes = glob(
-                self.secrets["default_path_to_images"] + "\\*[0-9][0-9]*"
-            )
-            if len(path_pastas_pacientes) > 0:
-                paths_e_ids = [
-                    (path, path.split("\\")[-1]) for path in path_pastas_pacientes
-                ]
-                for path_pasta, patient_id in paths_e_ids:
-                    quantidade_fotos = len(glob(path_pasta + "\\*MG*.jpg"))
-                    ja_tem_template = (
-                        len(glob(path_pasta + f"\\{patient_id}_*.jpg")) > 0
-                    )
-                    if ja_tem_template:
-                        self.paths_e_ids_pastas_8_imagens_para_upload.append(
-                            (path_pasta, patient_id)
-                        )
-                    elif quantidade_fotos == 8:
-                        self.paths_e_ids_pastas_8_imagens.append(
-                            (path_pasta, patient_id)
-                        )
-
-                for path, patient_id in self.paths_e_ids_pastas_8_imagens:
-                    renomear_imagens(path)
+    def refresh_paths_list(self, changed: set | None = None):
+        """
+        This function will update the lists of folders to process/upload. If changed (a set of
+        patient folder paths) is given, only those folders are checked (and renamed) again. The
+        timings of the last full scan and of renaming are kept in self.scan_stats and
+        self.rename_stats (and printed).
+        """
+        scan_stats = ScanStats() if changed is None else None
+        (
+            self.paths_e_ids_pastas_8_imagens,
+            self.paths_e_ids_pastas_8_imagens_para_upload,
+        ) = folders.classify_patient_folders(
+            self.secrets["default_path_to_images"],
+            len(self.layout.slots),
+            changed,
+            scan_stats,
+        )
+        if scan_stats is not None:
+            self.scan_stats = scan_stats
+            print(scan_stats.report())
+
+        to_rename = [path for path, _ in self.paths_e_ids_pastas_8_imagens]
+        if changed is not None:
+            to_rename = [path for path in to_rename if path in changed]
+        self.rename_stats = ScanStats(action="Renamed")
+        folders.rename_all(to_rename, self.rename_stats)
+        if self.rename_stats.folders > 0:
+            print(self.rename_stats.report())
 
     def button_states(self, state):
+        self.busy = state == tk.DISABLED
         self.widgets["btn_search_folder"].configure(state=state)
         self.widgets["btn_refresh"].configure(state=state)
         self.widgets["btn_assemble"].configure(state=state)
         self.widgets["btn_upload"].configure(state=state)
         self.widgets["btn_rembg_FOLDER"].configure(state=state)
 
+    def _end_batch(self) -> None:
+        """
+        This function will enable the buttons again after a batch and then update the lists of
+        folders to process/upload (if that fails, the buttons are enabled anyway).
+        """
+        self.button_states(tk.NORMAL)
+        self.check_folders()
+
     def assemble_all_templates(self):
         self.button_states(tk.DISABLED)
+        try:
+            total, failures = self._assemble_pending_templates()
+        finally:
+            # Whatever happens, the watcher is listened to again and the buttons come back.
+            self.busy = False
+            self.after(3000, self._end_batch)
+
+        if len(failures) > 0:
+            messagebox.showwarning(
+                # Finished
+                title="Templates montados.",
+                # X of Y templates failed (see the error log).
+                message=(
+                    f"Falha ao montar {len(failures)} de {total} templates: "
+                    f"{', '.join(failures)}.\nDetalhes em Resources/Erros/erros.txt."
+                ),
+                parent=self,
+            )
+            return
+        messagebox.showinfo(
+            # Finished
+            title="Templates montados.",
+            message="Todos templates montados com sucesso!",
+            parent=self,
+            # This specific icon removes the bell noise from the messagebox.
+            # icon="question",
+        )
+
+    def _assemble_pending_templates(self) -> tuple[int, list]:
+        """
+        This function will assemble the templates of every folder ready for it. A failed patient
+        doesn't stop the others. It returns how many were tried and the failed patients' IDs.
+        """
         self.check_folders()
+        jobs = journal.Journal()
+        total = len(self.paths_e_ids_pastas_8_imagens)
+        failures = []
         for path_pasta, patient_id in self.paths_e_ids_pastas_8_imagens:
             self.widgets["lbl_to_process"].configure(
                 text=f"Montando template do paciente {patient_id}",
                 # fg=self.RED,
             )
-            commands.montar_template(patient_id, path_pasta, self.template)
+            try:
+                with jobs.stage(
+                    path_pasta,
+                    patient_id,
+                    journal.ASSEMBLED,
+                    journal.photos_fingerprint(path_pasta),
+                ):
+                    commands.montar_template(
+                        patient_id,
+                        path_pasta,
+                        self.template,
+                        self.layout,
+                        on_preview=self.show_template_preview,
+                    )
+            except Exception as err:  # pylint: disable=broad-except
+                # The journal has the error (it's retried next time), the others go on.
+                failures.append(patient_id)
+                commands.salvar_info_erro(f"ID {patient_id}: {err}")
         self.widgets["lbl_to_process"].configure(
-            text="Templates montados",
+            # Templates assembled (X failed).
+            text=(
+                f"Templates montados ({len(failures)} com erro)."
+                if len(failures) > 0
+                else "Templates montados"
+            ),
             # fg=self.GREEN,
         )
         # self.after(
         # 3000, lambda: self.widgets["lbl_to_process"].configure(fg=self.TEXT_COLOR)
         # )
-        self.after(3000, lambda: (self.check_folders(), self.button_states(tk.NORMAL)))
-        messagebox.showinfo(
-            # Finished
-            title="Templates montados.",
-            message="Todos templates montados com sucesso!",
-            parent=self,
-            # This specific icon removes the bell noise from the messagebox.
-            # icon="question",
-        )
+        return total, failures
 
     def upload_all_templates(self):
         self.button_states(tk.DISABLED)
-        self.check_folders()
-        for path_pasta, patient_id in self.paths_e_ids_pastas_8_imagens_para_upload:
-            self.widgets["lbl_to_upload"].configure(
-                text=f"Fazendo upload template {patient_id}",
-                # fg=self.RED,
+        try:
+            self.check_folders()
+            total = len(self.paths_e_ids_pastas_8_imagens_para_upload)
+
+            def show_progress(result, done):
+                self.widgets["lbl_to_upload"].configure(
+                    text=f"Fazendo upload templates ({done}/{total}): {result.patient_id}",
+                    # fg=self.RED,
+                )
+
+            results = uploader.upload_templates(
+                self.paths_e_ids_pastas_8_imagens_para_upload, on_result=show_progress
             )
-            commands.upload_template(path_pasta, patient_id)
+        finally:
+            self.busy = False
+            self.after(3000, self._end_batch)
+        failures = [result.patient_id for result in results if not result.ok]
+        skipped = sum(result.skipped for result in results)
         self.widgets["lbl_to_upload"].configure(
-            text="Uploads finalizados.",
+            # Uploads finished (X were already uploaded).
+            text=(
+                f"Uploads finalizados ({skipped} já enviados)."
+                if skipped > 0
+                else "Uploads finalizados."
+            ),
             # fg=self.GREEN,
         )
         # self.after(
         # 3000, lambda: self.widgets["lbl_to_upload"].configure(fg=self.TEXT_COLOR)
         # )
-        self.after(3000, lambda: (self.check_folders(), self.button_states(tk.NORMAL)))
+        if len(failures) > 0:
+            messagebox.showwarning(
+                # Finished
+                title="Upload finalizado.",
+                # X of Y uploads failed (see the error log).
+                message=(
+                    f"Falha no upload de {len(failures)} de {total} templates: "
+                    f"{', '.join(failures)}.\nDetalhes em Resources/Erros/erros.txt."
+                ),
+                parent=self,
+            )
+            return
         messagebox.showinfo(
             # Finished
             title="Upload finalizado.",
@@ -508,17 +646,30 @@ class MainWindow(ctk.CTk):
             # icon="question",
         )
 
-    # def update_template_on_screen(self):
-    # tktemplate = ImageTk.PhotoImage(
-    # Image.fromarray(np.array(self.template)).resize((350, 250))
-    # )
-    #     self.canvas.itemconfig(self.img_container, image=tktemplate)
+    def show_template_preview(self, path: str, preview) -> None:
+        """
+        This function will show an assembled template's preview (see commands.make_preview). It
+        can be called from any thread: the preview is shown by Tk's thread, so assembling never
+        waits for it.
+        """
+        self.after(0, self._update_template_on_screen, path, preview)
+
+    def _update_template_on_screen(self, path: str, preview) -> None:
+        if self.preview_window is None or not self.preview_window.winfo_exists():
+            self.preview_window = TemplatePreview(self)
+        self.preview_window.show(os.path.basename(path), preview)
 
     def lbl_to_process(self):
         if len(self.paths_e_ids_pastas_8_imagens) > 0:
             txt = ", ".join([p_id for _, p_id in self.paths_e_ids_pastas_8_imagens])
         else:
             txt = "Vazio"
+        if self.scan_stats is not None:
+            # X folders checked in Y seconds.
+            txt += (
+                f"\n({self.scan_stats.folders} pastas verificadas em "
+                f"{self.scan_stats.seconds:.1f}s)"
+            )
         return f"Pastas com 8 imagens sem templates montados:\n{txt}"
 
     def lbl_to_upload(self):
@@ -532,6 +683,9 @@ class MainWindow(ctk.CTk):
 
     def check_folders(self):
         self.refresh_paths_list()
+        self.update_folder_labels()
+
+    def update_folder_labels(self):
         self.widgets["lbl_to_process"].configure(text=self.lbl_to_process())
         self.widgets["lbl_to_upload"].configure(text=self.lbl_to_upload())
 
@@ -0,0 +1,41 @@
+"""
+This module implements the template preview window.
+"""
+
+import customtkinter as ctk  # type: ignore[import]
+from PIL import Image, ImageTk  # type: ignore[import]
+
+
+class TemplatePreview(ctk.CTkToplevel):
+    """
+    This top level will show a small preview of the last assembled template (see
+    commands.make_preview), so it can be checked without opening the template itself. Its
+    PhotoImage is created once and reused: previews of the same size are pasted into it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.photo: ImageTk.PhotoImage | None = None
+
+        self.title("Template")
+        self.resizable(width=False, height=False)
+
+        self.lbl_preview = ctk.CTkLabel(master=self, text="")
+        self.lbl_preview.pack(padx=10, pady=(10, 0))
+        self.lbl_name = ctk.CTkLabel(master=self, text="")
+        self.lbl_name.pack(padx=10, pady=(0, 10))
+
+    def show(self, name: str, preview: Image.Image) -> None:
+        """
+        This function will show a template's preview (and its name). It must be called from Tk's
+        thread.
+        """
+        size = (self.photo.width(), self.photo.height()) if self.photo else None
+        if size == preview.size:
+            self.photo.paste(preview)
+        else:
+            self.photo = ImageTk.PhotoImage(preview)
+            self.lbl_preview.configure(image=self.photo)
+        self.lbl_name.configure(text=name)
+        self.deiconify()
+        self.lift()
@@ -17,7 +17,12 @@ screen.
 #     pass
 
 # Imports will only correctly happen if the venv is activated.
-from gui import main_window  # type: ignore[import]
+# The startup's clock starts when utilities.startup is imported, so it comes first. Only what the
+# loading screen needs is imported here, everything else is loaded by the warm-up.
+import time
+import importlib
+from utilities import startup  # type: ignore[import]
+from utilities.paths import join_pr  # type: ignore[import]
 from gui.loading_screen import LoadingScreen  # type: ignore[import]
 
 # If you don't want to activate HiDPI compatibility in your python executables, uncomment these two:
@@ -25,15 +30,75 @@ from gui.loading_screen import LoadingScreen  # type: ignore[import]
 # windll.shcore.SetProcessDpiAwareness(1)
 
 
+def warm_up_steps() -> list[startup.Step]:
+    """
+    This function will list what's loaded at startup, in order. The main window needs its
+    modules (each slow import is a step of its own, so the startup report shows its import time);
+    the heavy resources keep loading in the background after the main window shows up.
+    """
+
+    def load_template() -> None:
+        from utilities import commands  # type: ignore[import]
+        from utilities.layout import load_layout  # type: ignore[import]
+        from utilities.my_secrets import get_secrets  # type: ignore[import]
+
+        layout = load_layout(get_secrets().get("layout", "default"))
+        commands.load_template(layout.background)
+
+    def load_fonts() -> None:
+        from utilities import commands  # type: ignore[import]
+
+        for font in commands.HEADER_FONTS:
+            commands.load_font(*font)
+
+    def load_model() -> None:
+        from utilities import bg_model  # type: ignore[import]
+
+        bg_model.prepare()
+
+    def load_module(name: str):
+        return lambda: importlib.import_module(name)
+
+    return [
+        startup.Step("customtkinter", load_module("customtkinter")),
+        startup.Step("numpy", load_module("numpy")),
+        startup.Step("requests", load_module("requests")),
+        startup.Step("main window", load_module("gui.main_window")),
+        startup.Step("template", load_template, required=False),
+        startup.Step("fonts", load_fonts, required=False),
+        startup.Step("rembg model", load_model, required=False),
+    ]
+
+
+def report_startup(root, warm_up: startup.WarmUp) -> None:
+    """
+    This function will print the startup report (and add it to "resources/startup.log", to keep
+    track of the time to the first window) once every step is done.
+    """
+    if not warm_up.wait(0):
+        root.after(500, report_startup, root, warm_up)
+        return
+    report = warm_up.report()
+    print(report)
+    with open(join_pr("resources", "startup.log"), "a", encoding="utf-8") as log:
+        log.write(f"{time.strftime('%d/%m/%Y %H:%M:%S')} {report}\n")
+
+
 def main() -> int:
     """
     This function will start the app.
     """
-    # This will force loading screen to stay up until rembg is imported (it is a slow import).
-    loading_screen = LoadingScreen(wait_for=[main_window.imp_th])
+    # The loading screen stays up (showing the warm-up's progress) until the main window's
+    # modules are loaded. rembg's model (a slow load) and the other heavy resources keep loading.
+    warm_up = startup.WarmUp(warm_up_steps()).start()
+    loading_screen = LoadingScreen(warm_up=warm_up)
     loading_screen.mainloop()
 
+    from gui import main_window  # type: ignore[import]
+
     root = main_window.MainWindow()
+    root.after_idle(warm_up.mark, "first window")
+    root.after_idle(report_startup, root, warm_up)
     root.mainloop()
     return 0
 
@@ -0,0 +1,91 @@
+"""
+This module implements the app's client for the patients' API. Every request goes through a
+single pooled session (keep-alive, timeouts and retries with backoff) and patient records are
+cached in memory for a while, so assembling and uploading a patient's templates only fetches its
+record once.
+"""
+
+import time
+import threading
+import requests  # type: ignore[import]
+from requests.adapters import HTTPAdapter  # type: ignore[import]
+from urllib3.util.retry import Retry  # type: ignore[import]
+from .my_secrets import get_secrets
+
+_SESSION: requests.Session | None = None
+_SESSION_LOCK = threading.Lock()
+
+_PATIENTS: dict[int, tuple[float, dict]] = {}
+_PATIENTS_LOCK = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    This function will return the app's shared session, creating it on first use. Failed GETs
+    (connection errors and 429/5xx responses) are retried with exponential backoff ("api_retries"
+    in the secrets file). Uploads (PUTs) aren't retried here: the uploader retries them.
+    """
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            secrets = get_secrets()
+            retry = Retry(
+                total=secrets.get("api_retries", 3),
+                backoff_factor=0.5,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset({"GET"}),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=secrets.get("api_connections", 8),
+                max_retries=retry,
+            )
+            _SESSION = requests.Session()
+            _SESSION.headers["authorization"] = secrets["auth"]
+            _SESSION.mount("http://", adapter)
+            _SESSION.mount("https://", adapter)
+        return _SESSION
+
+
+def _timeout() -> float:
+    return get_secrets().get("api_timeout", 30)
+
+
+def get_patient(patient_id: int) -> dict:
+    """
+    This function will return a patient's record (searching the patient by its ID). Records are
+    cached for "patient_cache_ttl" seconds (secrets file).
+    """
+    secrets = get_secrets()
+    now = time.monotonic()
+    ttl = secrets.get("patient_cache_ttl", 600)
+    with _PATIENTS_LOCK:
+        cached = _PATIENTS.get(patient_id)
+    if cached is not None and now - cached[0] < ttl:
+        return cached[1]
+
+    # Pesquisando o paciente pelo Nº Manager
+    response = get_session().get(
+        secrets["api_link"],
+        data={secrets["patient_id_key"]: f"{patient_id}"},
+        timeout=_timeout(),
+    )
+    response.raise_for_status()
+    record = response.json()[0]
+
+    with _PATIENTS_LOCK:
+        _PATIENTS[patient_id] = (now, record)
+    return record
+
+
+def put_template(request_id: int, files: dict) -> requests.Response:
+    """
+    This function will upload files (as in requests' files argument) to a patient's request.
+    """
+    secrets = get_secrets()
+    response = get_session().put(
+        f"{secrets['api_link']}/{request_id}", files=files, timeout=_timeout()
+    )
+    response.raise_for_status()
+    return response
@@ -0,0 +1,240 @@
+"""
+This module implements loading rembg's models once and reusing them. Loading a model (and
+importing rembg itself) takes seconds, while removing the background of a photo with a loaded
+model takes a fraction of that: sessions are loaded once per model, can be prepared ahead of
+time (see prepare, main.py does it while the loading screen is up) and are shared by every
+background removal. Loading and inference times are measured separately.
+
+Sessions can be used from many threads at the same time (onnxruntime releases the GIL), so
+background removal runs "rembg_workers" images at once, each inference using "rembg_threads"
+threads (by default, the CPU count split between the workers).
+
+Masks are cached on disk (keyed by the image's content and the model), so removing the
+background of the same photo again (e.g. with a different fill color or after restoring it from
+"FACES_BG") doesn't run the model again.
+"""
+
+import os
+import time
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from PIL import Image  # type: ignore[import]
+import numpy as np
+from .my_secrets import get_secrets
+from .disk_cache import DiskCache, atomic_write, named_cache
+from .im_processing import downscale
+from . import masks
+
+
+@dataclass
+class ModelStats:
+    """
+    Timings of a model: how long loading it (including importing rembg) and warming it up took,
+    and how long its inferences took.
+    """
+
+    model_name: str
+    load_seconds: float = 0.0
+    warmup_seconds: float = 0.0
+    images: int = 0
+    inference_seconds: float = 0.0
+    error: str = ""
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, seconds: float) -> None:
+        """
+        This function will record an inference that took a given amount of seconds.
+        """
+        with self._lock:
+            self.images += 1
+            self.inference_seconds += seconds
+
+    def report(self) -> str:
+        """
+        A one line summary of this model's timings.
+        """
+        if self.error:
+            return f"{self.model_name}: failed to load ({self.error})."
+        average = self.inference_seconds / self.images if self.images > 0 else 0.0
+        return (
+            f"{self.model_name}: loaded in {self.load_seconds:.2f}s (warm-up "
+            f"{self.warmup_seconds:.2f}s), {self.images} image(s) in "
+            f"{self.inference_seconds:.2f}s ({average:.2f}s per image)."
+        )
+
+
+_sessions: dict = {}
+_loading: dict = {}
+_stats: dict = {}
+_lock = threading.Lock()
+
+
+def default_model() -> str:
+    """
+    The model used by default ("rembg_model" in the secrets file).
+    """
+    return get_secrets().get("rembg_model", "u2net_human_seg")
+
+
+def workers() -> int:
+    """
+    The amount of images processed at the same time ("rembg_workers" in the secrets file).
+    """
+    return max(1, get_secrets().get("rembg_workers", 2))
+
+
+def intra_op_threads() -> int:
+    """
+    The amount of threads each inference uses ("rembg_threads" in the secrets file, 0 splits the
+    CPU count between the workers).
+    """
+    threads = get_secrets().get("rembg_threads", 0)
+    if threads > 0:
+        return threads
+    return max(1, (os.cpu_count() or 1) // workers())
+
+
+def model_stats(model_name: str | None = None) -> ModelStats:
+    """
+    This function will return a model's timings.
+    """
+    model_name = model_name or default_model()
+    with _lock:
+        return _stats.setdefault(model_name, ModelStats(model_name))
+
+
+def get_session(model_name: str | None = None):
+    """
+    This function will return rembg's session for a model, loading it the first time (other
+    threads asking for the same model meanwhile wait for it instead of loading it again). The
+    session's inferences use intra_op_threads threads (set in its onnxruntime SessionOptions).
+    """
+    model_name = model_name or default_model()
+    stats = model_stats(model_name)
+    with _lock:
+        loading = _loading.setdefault(model_name, threading.Lock())
+    with loading:
+        if (session := _sessions.get(model_name)) is not None:
+            return session
+
+        start = time.perf_counter()
+        try:
+            import onnxruntime  # type: ignore[import]
+            from rembg.sessions import sessions_class  # type: ignore[import]
+
+            # The session is built like rembg's new_session does (rembg 2.0.50, see
+            # requirements.txt), with its own options.
+            session_class = next(
+                (cls for cls in sessions_class if cls.name() == model_name), None
+            )
+            if session_class is None:
+                raise ValueError(f"Modelo desconhecido: {model_name}")
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = intra_op_threads()
+            session = session_class(model_name, options)
+        except Exception as err:
+            stats.error = str(err) or type(err).__name__
+            raise
+        stats.load_seconds = time.perf_counter() - start
+        stats.error = ""
+        _sessions[model_name] = session
+        return session
+
+
+def prepare(model_name: str | None = None) -> None:
+    """
+    This function will load a model and run it once on a small blank image, so the first real
+    photo doesn't pay for any of it. Errors are kept in the model's stats (and raised).
+    """
+    model_name = model_name or default_model()
+    try:
+        session = get_session(model_name)
+        start = time.perf_counter()
+        session.predict(Image.new("RGB", (320, 320), (255, 255, 255)))
+        model_stats(model_name).warmup_seconds = time.perf_counter() - start
+    except Exception as err:
+        model_stats(model_name).error = str(err) or type(err).__name__
+        raise
+
+
+def mask_cache() -> DiskCache | None:
+    """
+    This function will return the on-disk cache of masks, creating it on first use. Its size is
+    set by "mask_cache_mb" in the secrets file (0 disables it).
+    """
+    return named_cache("masks", "mask_cache_mb", 512, ".png")
+
+
+def content_hash(data: bytes) -> str:
+    """
+    This function will return the hash identifying an image's content (its file's bytes).
+    """
+    return hashlib.sha1(data).hexdigest()
+
+
+def mask_key(image_hash: str, model_name: str | None = None, fast_size: int = 0) -> str:
+    """
+    This function will return the mask cache key of an image (see content_hash) for a model (and
+    the fast mode's size, if used).
+    """
+    key = f"{image_hash}|{model_name or default_model()}"
+    return f"{key}|fast{fast_size}" if fast_size else key
+
+
+def _infer(image: Image.Image, model_name: str) -> np.ndarray:
+    session = get_session(model_name)
+    from rembg import bg  # type: ignore[import]
+
+    start = time.perf_counter()
+    mask = np.asarray(bg.remove(image, session=session, only_mask=True).convert("L"))
+    model_stats(model_name).add(time.perf_counter() - start)
+    return mask
+
+
+def segment(
+    image: Image.Image,
+    model_name: str | None = None,
+    image_hash: str | None = None,
+    fast: bool | None = None,
+) -> np.ndarray:
+    """
+    This function will return an RGB image's mask (a uint8 array, 255 is foreground). In fast
+    mode ("fast_segmentation" in the secrets file, by default), the model gets a copy of image
+    reduced to "fast_segmentation_size" pixels (largest side) and only the mask's boundary is
+    refined at full resolution (see masks.upsample_and_refine). If image_hash is given (see
+    content_hash), masks are read from/written to the mask cache. The model's inference time is
+    added to its stats.
+    """
+    model_name = model_name or default_model()
+    secrets = get_secrets()
+    if fast is None:
+        fast = secrets.get("fast_segmentation", False)
+    fast_size = secrets.get("fast_segmentation_size", 1024) if fast else 0
+
+    cache = mask_cache() if image_hash is not None else None
+    if cache is not None:
+        key = mask_key(image_hash, model_name, fast_size)
+        if (cached := cache.get(key)) is not None:
+            try:
+                with Image.open(cached) as cached_mask:
+                    mask = np.asarray(cached_mask.convert("L"))
+                if mask.shape == (image.height, image.width):
+                    return mask
+            except OSError:
+                pass
+
+    if fast:
+        small_mask = _infer(downscale(image, fast_size), model_name)
+        mask = masks.upsample_and_refine(image, small_mask)
+    else:
+        mask = _infer(image, model_name)
+
+    if cache is not None:
+        # Masks are mostly flat, so even the fastest PNG compression makes them small.
+        atomic_write(
+            cache.path(key),
+            lambda file: Image.fromarray(mask).save(file, "PNG", compress_level=1),
+        )
+        cache.evict()
+    return mask
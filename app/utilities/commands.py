@@ -4,16 +4,22 @@ Utility commands for processing and uploading images.
 
 from glob import glob
 import os
-import io
-import multiprocessing
 import datetime
 import time
 import threading
-from skimage.io import imsave  # type: ignore[import]
-import requests  # type: ignore[import]
+from functools import lru_cache
+from typing import Callable
+from multiprocessing import shared_memory
 from PIL import ImageDraw, Image, ImageFont  # type: ignore[import]
 import numpy as np
 from .my_secrets import get_secrets
+from . import api
+from .workers import get_pool
+from .layout import Layout, Slot, load_layout
+from .disk_cache import DiskCache, atomic_write, named_cache
+from .paths import join_pr
+from .encoder import save_jpeg
+from .im_processing import downscale
 
 # import skimage
 
@@ -26,174 +32,358 @@ def background(func, args=None):
     thread.start()
 
 
-def read_and_process_image(position_path: tuple[int, str]) -> np.ndarray:
+def load_slot_image(path: str, size: tuple[int, int], fast: bool = True) -> Image.Image:
     """
-    This function will read a given image and resize it accordingly.
+    This function will read an image and resize it to a given (width, height) size. If fast is
+    True, JPEGs are decoded at a reduced resolution (DCT scaling, still at least as big as size)
+    and the resizing starts with a cheap reduction, which is a lot faster for camera photos.
     """
-    position, path = position_path
+    img = Image.open(path)
+    if not fast:
+        return img.resize(size)
 
-    # print(f'Carregando e redimensionando imagem {position}.')
-    img = Image.open(glob(f'{path + "/" + str(position)}*MG*[0-9]*.jpg')[0])
+    img.draft("RGB", size)
+    return img.resize(size, reducing_gap=3.0)
 
-    if position > 3:
-        return np.array(img.resize((1025, 732))).astype(int)
 
-    return np.array(img.resize((716, 1074))).astype(int)
+def slot_cache() -> DiskCache | None:
+    """
+    This function will return the on-disk cache of resized slot images, creating it on first
+    use. Its size is set by "slot_cache_mb" in the secrets file (0 disables it).
+    """
+    return named_cache("slots", "slot_cache_mb", 1024, ".npy")
 
 
-def montar_template(patient_id, path_pasta, template):
-    def info_paciente_para_template(patient_id):
-        secret = get_secrets()
-        headers = {"authorization": secret["auth"]}
-        params = {secret["patient_id_key"]: f"{patient_id}"}
-        url = secret["api_link"]
-        response = requests.get(
-            url, headers=headers, data=params
-        )  # Pesquisando o paciente pelo Nº Manager
-        info_dict = response.json()[0]
+def slot_image_key(path: str, size: tuple[int, int], fast: bool) -> str:
+    """
+    This function will return the slot cache key of an image: its identity (path, modification
+    time and size) and how it should be resized.
+    """
+    stat = os.stat(path)
+    return (
+        f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}|"
+        f"{size[0]}x{size[1]}|{'fast' if fast else 'full'}"
+    )
 
-        imagem_dados_paciente = Image.new("RGB", (1200, 308), color=(255, 255, 255))
-        draw_img = ImageDraw.Draw(imagem_dados_paciente)
 
-        font1 = ImageFont.truetype("./Fontes/verdanab.ttf", 55)
-        font2 = ImageFont.truetype("./Fontes/verdana.ttf", 55)
+def read_and_process_image(job: tuple[Slot, str, bool, str | None, str, tuple]) -> int:
+    """
+    This function will read a given slot's image, resize it to the slot's size and write it
+    straight into a shared memory canvas (so no pixels have to be sent back to the caller). If
+    cache_path isn't None, the resized image is also saved there (as a .npy file). It returns the
+    slot's position.
+    """
+    slot, path, fast, cache_path, canvas_name, canvas_shape = job
 
-        nome_paciente_escrever = info_dict["patient_datum"]["name"]
-        nome_dr = info_dict["dentist_datum"]["name"]
-        nome_dr_escrever = f"Dr(a). {nome_dr}"
+    # print(f'Carregando e redimensionando imagem {slot.position}.')
+    pixels = np.asarray(load_slot_image(path, slot.size, fast))
 
-        birth_date = datetime.datetime.strptime(
-            info_dict["patient_datum"]["birthdate"], "%Y-%m-%d"
-        )
-        end_date = datetime.datetime.strptime(
-            info_dict["date"][:-10], "%Y-%m-%dT%H:%M:%S"
-        )
-        idade = (end_date - birth_date) / datetime.timedelta(days=365.2425)  # 365.2425
-        idade_escrever = f"{int(idade)}a {int((idade - int(idade)) * 12)}m"
-        nascimento = birth_date.strftime("%d/%m/%Y")
-        nascimento_escrever = f"Data Nasc.: {nascimento} Idade: {idade_escrever}"
-        data = end_date.strftime("%d/%m/%Y")
-        data_escrever = f"Data: {data}"
-
-        left_border_dist = 35
-        draw_img.text(
-            (left_border_dist, 35), nome_paciente_escrever, font=font1, fill=(0, 0, 0)
-        )
-        draw_img.text(
-            (left_border_dist, 105), nome_dr_escrever, font=font2, fill=(0, 0, 0)
-        )
-        draw_img.text(
-            (left_border_dist, 175), nascimento_escrever, font=font2, fill=(0, 0, 0)
-        )
-        draw_img.text(
-            (left_border_dist, 245), data_escrever, font=font2, fill=(0, 0, 0)
-        )
+    shm = shared_memory.SharedMemory(name=canvas_name)
+    try:
+        canvas = np.ndarray(canvas_shape, dtype=np.uint8, buffer=shm.buf)
+        canvas[slot.region] = pixels
+    finally:
+        # The canvas has to be released before closing the shared memory.
+        canvas = None
+        shm.close()
 
-        imagem_dados_paciente = np.array(imagem_dados_paciente)
-        return imagem_dados_paciente, nome_paciente_escrever
+    if cache_path is not None:
+        atomic_write(cache_path, lambda file: np.save(file, pixels))
+    return slot.position
 
-    # print('''Carregando imagens...\nAguarde alguns instantes...''')
+
+def _load_cached_slot(cache: DiskCache, key: str, shape: tuple) -> np.ndarray | None:
+    if (cached := cache.get(key)) is None:
+        return None
     try:
-        patient_id = int(patient_id)
-    except ValueError:
+        pixels = np.load(cached)
+    except (OSError, ValueError):
+        return None
+    return pixels if pixels.shape == shape else None
+
+
+def assemble_template(
+    path_pasta: str,
+    template: np.ndarray,
+    layout: Layout,
+    header: np.ndarray | None,
+    output_path: str,
+    fast_decode: bool = True,
+    on_preview: Callable[[str, Image.Image], None] | None = None,
+) -> None:
+    """
+    This function will write a header and a patient's photos over a copy of a blank (uint8)
+    template and save it to output_path. The copy lives in shared memory so the shared pool's
+    processes can decode the photos directly into it. Template itself isn't changed.
+    Photos already in the slot cache aren't decoded again. See load_slot_image for fast_decode.
+    If on_preview is given, it's called with output_path and a preview of the template (see
+    make_preview), made from the canvas (the saved file isn't read again).
+    """
+    cache = slot_cache()
+    shm = shared_memory.SharedMemory(create=True, size=template.nbytes)
+    try:
+        canvas = np.ndarray(template.shape, dtype=np.uint8, buffer=shm.buf)
+        canvas[:] = template
+        if header is not None:
+            canvas[layout.header.region] = header
+
+        jobs = []
+        for slot in layout.slots:
+            path = glob(os.path.join(path_pasta, f"{slot.position}*MG*[0-9]*.jpg"))[0]
+            cache_path = None
+            if cache is not None:
+                key = slot_image_key(path, slot.size, fast_decode)
+                shape = (slot.height, slot.width, canvas.shape[2])
+                if (pixels := _load_cached_slot(cache, key, shape)) is not None:
+                    canvas[slot.region] = pixels
+                    continue
+                cache_path = cache.path(key)
+            jobs.append((slot, path, fast_decode, cache_path, shm.name, canvas.shape))
+
+        for _ in get_pool().map(read_and_process_image, jobs):
+            pass
+        if cache is not None and len(jobs) > 0:
+            cache.evict()
+
+        save_jpeg(canvas, output_path)
+        if on_preview is not None:
+            on_preview(output_path, make_preview(canvas))
+    finally:
+        canvas = None
+        shm.close()
+        shm.unlink()
+
+
+PREVIEW_SIZE = 350
+
+
+def make_preview(canvas: np.ndarray, max_side: int = PREVIEW_SIZE) -> Image.Image:
+    """
+    This function will return a small copy of an assembled template (its largest side is
+    max_side), for showing it on screen. Most of the shrinking is a cheap reduction by a whole
+    factor (see im_processing.downscale), so it costs a fraction of encoding the template.
+    """
+    # The canvas may be released right after this (e.g. shared memory), so nothing points to it.
+    return downscale(Image.fromarray(canvas), max_side).copy()
+
+
+def template_cache() -> DiskCache | None:
+    """
+    This function will return the on-disk cache of decoded blank templates (as .npy files),
+    creating it on first use. Its size is set by "template_cache_mb" in the secrets file (0
+    disables it).
+    """
+    return named_cache("templates", "template_cache_mb", 256, ".npy")
+
+
+def load_template(path: str) -> np.ndarray:
+    """
+    This function will return a blank template (e.g. a layout's background) decoded. It's only
+    decoded once: the pixels are cached as a .npy file (until the image file changes) and memory
+    mapped from there, so the returned array is read-only. Assembling copies it (see
+    assemble_template), so every assembly gets its own canvas.
+    """
+    stat = os.stat(path)
+    return _load_template(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=4)
+def _load_template(path: str, mtime_ns: int, size: int) -> np.ndarray:
+    cache = template_cache()
+    key = f"{path}|{mtime_ns}|{size}|template"
+    if cache is not None and (cached := cache.get(key)) is not None:
         try:
-            patient_id = int(patient_id.split("-")[0])
-        except ValueError:
-            salvar_info_erro("Erro ao identificar ID.\n"):
-            raise ValueError # TODO: Create custom exception.
+            return np.load(cached, mmap_mode="r")
+        except (OSError, ValueError):
+            pass
+
+    with Image.open(path) as image:
+        pixels = np.array(image)
+    pixels.flags.writeable = False
+    if cache is None:
+        return pixels
+    try:
+        atomic_write(cache.path(key), lambda file: np.save(file, pixels))
+        cache.evict()
+        return np.load(cache.path(key), mmap_mode="r")
+    except (OSError, ValueError):
+        return pixels
 
-    # print(f'Procurando dados do paciente {patient_id} e escrevendo no template...\n')
 
-    cabecalho, nome_paciente = info_paciente_para_template(patient_id)
-    template[:308, :1200, :] = cabecalho
+HEADER_FONTS = (("verdanab.ttf", 55), ("verdana.ttf", 55))
 
-    with multiprocessing.Pool() as pool:
-        images = pool.map(
-            read_and_process_image,
-            list(map(lambda n: (n, path_pasta), tuple(range(1, 9)))),
-        )
 
-    # 716x1074
-    # ExtraOral Frontal
-    template[485 : 485 + 1074, 48 : 48 + 716, :] = images[1 - 1]
-    # ExtraOral Lateral
-    template[485 : 485 + 1074, 844 : 844 + 716, :] = images[3 - 1]
-    # ExtraOral Frontal Sorriso
-    template[485 : 485 + 1074, 1588 : 1588 + 716, :] = images[2 - 1]
-
-    # 1025x732
-    # IntraOral Oclusal Superior
-    template[20 : 20 + 732, 2410 : 2410 + 1025, :] = images[8 - 1]
-    # IntraOral Oclusal Inferior
-    template[827 : 827 + 732, 2410 : 2410 + 1025, :] = images[7 - 1]
-    # IntraOral Lateral Direita
-    template[1654 : 1654 + 732, 48 : 48 + 1025, :] = images[5 - 1]
-    # IntraOral Frontal
-    template[1654 : 1654 + 732, 1220 : 1220 + 1025, :] = images[4 - 1]
-    # IntraOral Lateral Esquerda
-    template[1654 : 1654 + 732, 2410 : 2410 + 1025, :] = images[6 - 1]
-
-    template_file_name = f'\\{patient_id}_{"_".join(nome_paciente.split())}.jpg'
-    imsave(path_pasta + template_file_name, template)
-
-    objetiva = path_pasta + "\\OBJETIVA"
-    if os.path.exists(objetiva):
-        # p_id = path_pasta.split("\\")[-1]
-        # print(f'Montando template OBJETIVA do paciente {p_id}\n')
-        montar_template(patient_id, objetiva, template)
+@lru_cache(maxsize=None)
+def load_font(file_name: str, size: int) -> ImageFont.FreeTypeFont:
+    """
+    This function will load one of the fonts in the "fonts" folder. Fonts are loaded once per
+    process.
+    """
+    return ImageFont.truetype(join_pr("fonts", file_name), size)
 
 
-def salvar_info_erro(error_info):
-    with open("./Resources/Erros/erros.txt", "a", encoding="utf-8") as file:
-        file.write(
-            f'{time.strftime("%H:%M:%S %d/%m/%Y", time.localtime())} - {error_info}\n'
-        )
+@lru_cache(maxsize=256)
+def render_header(
+    nome_paciente: str,
+    nome_dr: str,
+    birthdate: str,
+    date: str,
+    size: tuple[int, int],
+) -> np.ndarray:
+    """
+    This function will draw a template's header (patient, dentist, birthdate/age and date) and
+    return its pixels. Headers are memoized by these fields, so the returned array is read-only.
+    """
+    imagem_dados_paciente = Image.new("RGB", size, color=(255, 255, 255))
+    draw_img = ImageDraw.Draw(imagem_dados_paciente)
 
+    font1, font2 = (load_font(*font) for font in HEADER_FONTS)
 
-def upload_template(path, patient_id):
+    nome_dr_escrever = f"Dr(a). {nome_dr}"
+
+    birth_date = datetime.datetime.strptime(birthdate, "%Y-%m-%d")
+    end_date = datetime.datetime.strptime(date[:-10], "%Y-%m-%dT%H:%M:%S")
+    idade = (end_date - birth_date) / datetime.timedelta(days=365.2425)  # 365.2425
+    idade_escrever = f"{int(idade)}a {int((idade - int(idade)) * 12)}m"
+    nascimento = birth_date.strftime("%d/%m/%Y")
+    nascimento_escrever = f"Data Nasc.: {nascimento} Idade: {idade_escrever}"
+    data = end_date.strftime("%d/%m/%Y")
+    data_escrever = f"Data: {data}"
+
+    left_border_dist = 35
+    draw_img.text((left_border_dist, 35), nome_paciente, font=font1, fill=(0, 0, 0))
+    draw_img.text((left_border_dist, 105), nome_dr_escrever, font=font2, fill=(0, 0, 0))
+    draw_img.text(
+        (left_border_dist, 175), nascimento_escrever, font=font2, fill=(0, 0, 0)
+    )
+    draw_img.text((left_border_dist, 245), data_escrever, font=font2, fill=(0, 0, 0))
+
+    pixels = np.array(imagem_dados_paciente)
+    pixels.flags.writeable = False
+    return pixels
+
+
+def parse_patient_id(patient_id) -> int:
+    """
+    Patient folders are named after the patient's ID, optionally followed by "-<anything>". This
+    function will return the ID as an int, raising ValueError if it isn't valid.
+    """
     try:
-        patient_id = int(patient_id)
+        return int(patient_id)
     except ValueError:
         try:
-            patient_id = int(patient_id.split("-")[0])
-        except ValueError:
-            salvar_info_erro(f"ID {patient_id}: Erro conversão str->int")
-            return
-    try:
-        template_file_name = f"\\{patient_id}_*.jpg"
-        template_path = glob(path + template_file_name)[0]
-    except:
-        salvar_info_erro(f"ID {patient_id}: Template não existe")
-        return
+            return int(patient_id.split("-")[0])
+        except ValueError as err:
+            raise ValueError("Erro conversão str->int") from err
+
+
+def montar_template(
+    patient_id,
+    path_pasta,
+    template,
+    layout: Layout | None = None,
+    fast_decode: bool | None = None,
+    on_preview: Callable[[str, Image.Image], None] | None = None,
+):
+    """
+    This function will assemble a patient's template (and the "OBJETIVA" one, if that subfolder
+    exists) by writing the patient's header and photos over a copy of template (a blank uint8
+    template), following a layout. Layout and fast_decode (see load_slot_image) default to what
+    is set in the secrets file. See assemble_template for on_preview.
+    """
+    if layout is None:
+        layout = load_layout(get_secrets().get("layout", "default"))
+    if fast_decode is None:
+        fast_decode = get_secrets().get("fast_decode", True)
+    layout.check_canvas(template.shape)
 
-    secrets = get_secrets()
+    def info_paciente_para_template(patient_id, size):
+        info_dict = api.get_patient(patient_id)
+
+        nome_paciente_escrever = info_dict["patient_datum"]["name"]
+        imagem_dados_paciente = render_header(
+            nome_paciente_escrever,
+            info_dict["dentist_datum"]["name"],
+            info_dict["patient_datum"]["birthdate"],
+            info_dict["date"],
+            size,
+        )
+        return imagem_dados_paciente, nome_paciente_escrever
+
+    # print('''Carregando imagens...\nAguarde alguns instantes...''')
     try:
-        headers = {"authorization": secrets["auth"]}
+        patient_id = parse_patient_id(patient_id)
+    except ValueError:
+        salvar_info_erro("Erro ao identificar ID.\n")
+        raise
 
-        data = {secrets["patient_id_key"]: f"{patient_id}"}
+    # print(f'Procurando dados do paciente {patient_id} e escrevendo no template...\n')
 
-        url = secrets["api_link"]
+    cabecalho, nome_paciente = info_paciente_para_template(
+        patient_id, layout.header.size
+    )
+
+    template_file_name = f'{patient_id}_{"_".join(nome_paciente.split())}.jpg'
+    assemble_template(
+        path_pasta,
+        template,
+        layout,
+        cabecalho,
+        os.path.join(path_pasta, template_file_name),
+        fast_decode,
+        on_preview,
+    )
+
+    objetiva = os.path.join(path_pasta, "OBJETIVA")
+    if os.path.exists(objetiva):
+        # p_id = path_pasta.split("\\")[-1]
+        # print(f'Montando template OBJETIVA do paciente {p_id}\n')
+        montar_template(patient_id, objetiva, template, layout, fast_decode, on_preview)
 
-        # Pesquisando o paciente pelo Nº Manager
-        response = requests.get(url, headers=headers, data=data)
-        basic_info = response.json()[0]
-        # print(f'Nome: {basic_info["patient_datum"]["name"]}')
 
-        # Obtém o resquest_id para acessar todas informações do paciente
-        request_id = basic_info["id"]
+def salvar_info_erro(error_info):
+    """
+    This function will add an error to the error log ("Resources/Erros/erros.txt", in the
+    project's folder). Logging is best effort: if the log can't be written, the error is only
+    printed (so it never hides the error being logged).
+    """
+    path = join_pr("Resources", "Erros", "erros.txt")
+    line = f'{time.strftime("%H:%M:%S %d/%m/%Y", time.localtime())} - {error_info}\n'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a", encoding="utf-8") as file:
+            file.write(line)
+    except OSError as err:
+        print(f"Error log unavailable ({err}): {line}", end="")
 
-        url = f"{url}/{request_id}"
-        # r2 = requests.get(url,headers=headers) #Obtém informações completas do paciente
 
-        pil_im = Image.open(template_path)
-        bytes_io = io.BytesIO()
-        pil_im.save(bytes_io, "jpeg")
-        im_bytes = bytes_io.getvalue()
+def upload_template(path, patient_id):
+    """
+    This function will upload a patient's template (the "<patient id>_*.jpg" file in path). It
+    raises ValueError if the patient's ID isn't valid, FileNotFoundError if there is no template
+    and requests' exceptions if the upload fails.
+    """
+    patient_id = parse_patient_id(patient_id)
+    templates = glob(os.path.join(path, f"{patient_id}_*.jpg"))
+    if len(templates) == 0:
+        raise FileNotFoundError("Template não existe")
+    template_path = templates[0]
 
-        files = {secrets["files"]: im_bytes}
-        requests.put(
-            url, headers=headers, files=files
-        )  # Pesquisando o paciente pelo Nº Manager
-    except:
-        salvar_info_erro(f"ID {patient_id}: Erro no upload do template")
-        return
+    secrets = get_secrets()
+    # Pesquisando o paciente pelo Nº Manager
+    basic_info = api.get_patient(patient_id)
+    # print(f'Nome: {basic_info["patient_datum"]["name"]}')
+
+    # Obtém o resquest_id para acessar todas informações do paciente
+    request_id = basic_info["id"]
+
+    # The template is sent as is (it's already a JPEG): no decoding/encoding needed.
+    with open(template_path, "rb") as template_file:
+        files = {
+            secrets["files"]: (
+                os.path.basename(template_path),
+                template_file,
+                "image/jpeg",
+            )
+        }
+        api.put_template(request_id, files)
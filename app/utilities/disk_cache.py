@@ -0,0 +1,126 @@
+"""
+This module implements a simple size bounded on-disk cache. Entries are files in a folder, named
+after a hash of their keys. Reading an entry updates its modification time, so evicting the
+oldest files first evicts the least recently used entries. The app's caches live in
+resources/cache (see named_cache).
+"""
+
+import os
+import hashlib
+import threading
+from typing import Callable, BinaryIO
+from .my_secrets import get_secrets
+from .paths import join_pr
+
+_NAMED_CACHES: dict = {}
+_NAMED_CACHES_LOCK = threading.Lock()
+
+
+def atomic_write(path: str, write: Callable[[BinaryIO], None]) -> None:
+    """
+    This function will call write with a temporary file and then move it to path. Readers
+    (including other processes) will never see a partially written file.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as file:
+            write(file)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class DiskCache:
+    """
+    A folder of cached files limited to max_bytes. Entries may be written by other processes
+    (see atomic_write), but hits and misses are only counted for get calls in this process.
+    """
+
+    def __init__(self, folder: str, max_bytes: int, suffix: str = ""):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        """
+        This function will return the path of a key's file (whether it exists or not).
+        """
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.folder, digest + self.suffix)
+
+    def get(self, key: str) -> str | None:
+        """
+        This function will return the path of a key's file if it is cached, None otherwise.
+        """
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def evict(self) -> int:
+        """
+        This function will remove the least recently used files until the cache fits in
+        max_bytes. It returns how many files were removed.
+        """
+        entries = []
+        total = 0
+        with os.scandir(self.folder) as scan:
+            for entry in scan:
+                if entry.is_file() and entry.name.endswith(self.suffix):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                    total += stat.st_size
+
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Already evicted by someone else.
+                pass
+            except PermissionError:
+                # In use (Windows can't remove memory mapped files).
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def stats(self) -> str:
+        """
+        A short description of this cache's hits and misses.
+        """
+        lookups = self.hits + self.misses
+        ratio = self.hits / lookups * 100 if lookups > 0 else 0.0
+        return f"{self.hits} hit(s), {self.misses} miss(es) ({ratio:.0f}% hits)"
+
+
+def named_cache(
+    name: str, secret_key: str, default_mb: int, suffix: str = ""
+) -> DiskCache | None:
+    """
+    This function will return the app's on-disk cache called name (the resources/cache/<name>
+    folder), creating it on first use. Its size (in MB) is set by secret_key in the secrets file
+    (default_mb if it's missing, 0 disables it and None is returned).
+    """
+    with _NAMED_CACHES_LOCK:
+        if (cache := _NAMED_CACHES.get(name)) is None:
+            max_mb = get_secrets().get(secret_key, default_mb)
+            if not max_mb:
+                return None
+            cache = _NAMED_CACHES[name] = DiskCache(
+                join_pr("resources", "cache", name), max_mb * 2**20, suffix
+            )
+        return cache
@@ -0,0 +1,57 @@
+"""
+This module implements the app's JPEG encoder. Every JPEG the app writes (assembled templates and
+photos without background) is saved with Pillow using the same settings ("jpeg_encoder" in the
+secrets file): quality, chroma subsampling, progressive encoding and optimized Huffman tables.
+They trade encoding time (paid at assembly) for file size (paid at upload), see
+benchmarks/bench_encoder.py. The defaults write the same pixels skimage's imsave used to, with
+optimized Huffman tables (smaller files, same quality).
+"""
+
+from dataclasses import dataclass, asdict
+import numpy as np
+from PIL import Image  # type: ignore[import]
+from .my_secrets import get_secrets
+from .disk_cache import atomic_write
+
+
+@dataclass(frozen=True)
+class JpegSettings:
+    """
+    How JPEGs are encoded. Subsampling is Pillow's: "4:4:4" (none), "4:2:2" or "4:2:0".
+    """
+
+    quality: int = 75
+    subsampling: str = "4:2:0"
+    progressive: bool = False
+    optimize: bool = True
+
+    def describe(self) -> str:
+        """
+        A short description of these settings (e.g. "q75 4:2:0").
+        """
+        flags = [name for name in ("progressive", "optimize") if getattr(self, name)]
+        return " ".join([f"q{self.quality}", self.subsampling] + flags)
+
+
+def jpeg_settings() -> JpegSettings:
+    """
+    This function will return the encoder's settings ("jpeg_encoder" in the secrets file, missing
+    ones keep their defaults).
+    """
+    return JpegSettings(**get_secrets().get("jpeg_encoder", {}))
+
+
+def save_jpeg(
+    pixels: np.ndarray | Image.Image, path, settings: JpegSettings | None = None
+) -> None:
+    """
+    This function will save an RGB image (an array or a Pillow image) as a JPEG to path (a file
+    name or a file object) with settings (jpeg_settings by default). Files are written atomically
+    (see disk_cache.atomic_write), so a half written JPEG is never uploaded.
+    """
+    image = Image.fromarray(pixels) if isinstance(pixels, np.ndarray) else pixels
+    options = asdict(settings or jpeg_settings())
+    if isinstance(path, str):
+        atomic_write(path, lambda file: image.save(file, "JPEG", **options))
+    else:
+        image.save(path, "JPEG", **options)
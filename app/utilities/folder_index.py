@@ -0,0 +1,164 @@
+"""
+This module implements a persistent index of patient folders (an SQLite database). Each folder's
+photo count and whether it has a template are stored along with the folder's modification time.
+Refreshing the index lists the root folder once and only lists again the folders whose
+modification time changed (adding, removing or renaming files changes it), which is a lot
+cheaper than globbing every folder on network shares. Folders are checked concurrently.
+"""
+
+import os
+import time
+import sqlite3
+from contextlib import closing
+from fnmatch import fnmatch
+from .paths import join_pr
+from .scanner import ScanStats, map_folders
+
+PATIENT_FOLDER_PATTERN = "*[0-9][0-9]*"
+PHOTO_PATTERN = "*MG*.jpg"
+
+
+class FolderIndex:
+    """
+    The patient folders' index, stored in db_path.
+    """
+
+    def __init__(self, db_path: str | None = None):
+        self.db_path = db_path or join_pr("resources", "folder_index.sqlite3")
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with closing(self._connect()) as connection, connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS folders (
+                    root TEXT NOT NULL,
+                    path TEXT NOT NULL PRIMARY KEY,
+                    patient_id TEXT NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    photo_count INTEGER NOT NULL,
+                    has_template INTEGER NOT NULL
+                )
+                """)
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS folders_root ON folders (root)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    @staticmethod
+    def scan_folder(path: str, patient_id: str) -> tuple[int, bool]:
+        """
+        This function will list a patient folder once and return its amount of photos and
+        whether it has a template ("<patient id>_*.jpg").
+        """
+        photo_count = 0
+        has_template = False
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if fnmatch(entry.name, PHOTO_PATTERN):
+                    photo_count += 1
+                if fnmatch(entry.name, f"{patient_id}_*.jpg"):
+                    has_template = True
+        return photo_count, has_template
+
+    def refresh(
+        self, root: str, stats: ScanStats | None = None
+    ) -> list[tuple[str, str, int, bool]]:
+        """
+        This function will update the index with root's patient folders and return a list of
+        (folder path, patient id, photo count, has template) tuples, one per folder. Folders are
+        checked concurrently (see scanner.map_folders), with their timings added to stats.
+        """
+        stats = stats if stats is not None else ScanStats()
+        root_key = os.path.normcase(os.path.abspath(root))
+        with closing(self._connect()) as connection, connection:
+            known = {
+                path: (mtime_ns, photo_count, bool(has_template))
+                for path, mtime_ns, photo_count, has_template in connection.execute(
+                    "SELECT path, mtime_ns, photo_count, has_template FROM folders "
+                    "WHERE root = ?",
+                    (root_key,),
+                )
+            }
+
+            start = time.perf_counter()
+            with os.scandir(root) as entries:
+                candidates = [
+                    entry
+                    for entry in entries
+                    if not entry.name.startswith(".")
+                    and fnmatch(entry.name, PATIENT_FOLDER_PATTERN)
+                ]
+            # Listing root isn't a patient folder, but its time counts.
+            stats.add(time.perf_counter() - start, folders=0)
+            stats.seconds += time.perf_counter() - start
+
+            def check(entry: os.DirEntry) -> tuple | None:
+                # Returns the folder's (path, id, photo count, has template) and whether it
+                # had to be listed again.
+                try:
+                    if not entry.is_dir():
+                        return None
+                    mtime_ns = entry.stat().st_mtime_ns
+                    row = known.get(entry.path)
+                    if row is not None and row[0] == mtime_ns:
+                        return (entry.path, entry.name, *row[1:]), None
+                    photo_count, has_template = self.scan_folder(entry.path, entry.name)
+                except FileNotFoundError:
+                    # Removed while scanning.
+                    return None
+                folder = (entry.path, entry.name, photo_count, has_template)
+                return folder, (root_key, *folder[:2], mtime_ns, *folder[2:])
+
+            checked = [
+                result
+                for result in map_folders(check, candidates, stats)
+                if result is not None
+            ]
+            folders = [folder for folder, _ in checked]
+
+            connection.executemany(
+                "INSERT OR REPLACE INTO folders VALUES (?, ?, ?, ?, ?, ?)",
+                [changed for _, changed in checked if changed is not None],
+            )
+            gone = set(known) - {path for path, *_ in folders}
+            connection.executemany(
+                "DELETE FROM folders WHERE path = ?", [(path,) for path in gone]
+            )
+        return folders
+
+    def update(self, root: str, paths) -> list[tuple[str, str, int, bool]]:
+        """
+        This function will only list again the given patient folders of root (e.g. the ones a
+        FolderWatcher reported) and return all of root's indexed folders, like refresh does.
+        """
+        root_key = os.path.normcase(os.path.abspath(root))
+        with closing(self._connect()) as connection, connection:
+            for path in paths:
+                patient_id = os.path.basename(path)
+                try:
+                    mtime_ns = os.stat(path).st_mtime_ns
+                    photo_count, has_template = self.scan_folder(path, patient_id)
+                except (FileNotFoundError, NotADirectoryError):
+                    connection.execute("DELETE FROM folders WHERE path = ?", (path,))
+                    continue
+                connection.execute(
+                    "INSERT OR REPLACE INTO folders VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        root_key,
+                        path,
+                        patient_id,
+                        mtime_ns,
+                        photo_count,
+                        int(has_template),
+                    ),
+                )
+            return [
+                (path, patient_id, photo_count, bool(has_template))
+                for path, patient_id, photo_count, has_template in connection.execute(
+                    "SELECT path, patient_id, photo_count, has_template FROM folders "
+                    "WHERE root = ? ORDER BY rowid",
+                    (root_key,),
+                )
+            ]
@@ -0,0 +1,98 @@
+"""
+This module implements functions for finding and preparing patient folders.
+"""
+
+import os
+from glob import glob
+from .folder_index import FolderIndex
+from .journal import ASSEMBLED, RENAMED, Journal, photos_fingerprint
+from .scanner import ScanStats, map_folders
+
+
+def renomear_imagens(path: str) -> None:
+    """
+    This function will prefix the "*MG*.jpg" images of a patient folder (and its "OBJETIVA"
+    subfolder) with their position (1 through 8), if they don't start with a number already.
+    """
+    for number, image_path in enumerate(glob(os.path.join(path, "*MG*.jpg"))):
+        folder, file_name = os.path.split(image_path)
+        if file_name[0] not in "0123456789":
+            os.rename(image_path, os.path.join(folder, f"{number + 1}_{file_name}"))
+
+    objetiva = os.path.join(path, "OBJETIVA")
+    if os.path.exists(objetiva):
+        renomear_imagens(objetiva)
+
+
+def rename_folder(path: str, journal: Journal) -> None:
+    """
+    This function will call renomear_imagens for a patient folder and record it in the journal,
+    unless its photos didn't change since it was renamed.
+    """
+    if journal.is_done(path, RENAMED, photos_fingerprint(path)):
+        return
+    patient_id = os.path.basename(path)
+    try:
+        renomear_imagens(path)
+    except OSError as err:
+        journal.record(path, patient_id, RENAMED, "", str(err))
+        raise
+    journal.record(path, patient_id, RENAMED, photos_fingerprint(path))
+
+
+def rename_all(paths: list, stats: ScanStats | None = None) -> dict[str, str]:
+    """
+    This function will call rename_folder for many patient folders concurrently (see
+    scanner.map_folders), with their timings added to stats. A folder that can't be renamed
+    doesn't stop the others: it returns the failed folders' errors (by path), which are also
+    recorded in the journal.
+    """
+    journal = Journal()
+
+    def rename(path: str) -> str:
+        try:
+            rename_folder(path, journal)
+        except Exception as err:  # pylint: disable=broad-except
+            return str(err) or type(err).__name__
+        return ""
+
+    errors = map_folders(rename, paths, stats)
+    return {path: error for path, error in zip(paths, errors) if error}
+
+
+def classify_patient_folders(
+    root: str,
+    photos: int = 8,
+    changed: set | None = None,
+    stats: ScanStats | None = None,
+) -> tuple[list, list]:
+    """
+    This function will look for patient folders (folders with at least two consecutive digits in
+    their names) inside root, using the folder index. It returns two lists of (folder path,
+    patient id) tuples:
+    - Folders with all of their photos (8, by default) and no template yet (to assemble);
+    - Folders with a template already (to upload).
+    Folders whose last assembly failed (per the journal, e.g. the "OBJETIVA" template failed after
+    the main one was saved) are assembled again, even if they have a template.
+    If changed (a set of patient folder paths) is given, only those folders are listed again.
+    Otherwise, all folders are checked and the scan's timings are added to stats.
+    """
+    to_assemble: list = []
+    to_upload: list = []
+    if not os.path.exists(root):
+        return to_assemble, to_upload
+
+    if changed is None:
+        patient_folders = FolderIndex().refresh(root, stats)
+    else:
+        patient_folders = FolderIndex().update(root, changed)
+    failed = {path for path, _, _ in Journal().failed(ASSEMBLED)}
+    for path_pasta, patient_id, quantidade_fotos, ja_tem_template in patient_folders:
+        if path_pasta in failed and quantidade_fotos == photos:
+            to_assemble.append((path_pasta, patient_id))
+        elif ja_tem_template:
+            to_upload.append((path_pasta, patient_id))
+        elif quantidade_fotos == photos:
+            to_assemble.append((path_pasta, patient_id))
+
+    return to_assemble, to_upload
@@ -7,21 +7,17 @@ import os
 import io
 import shutil
 from glob import glob
-import threading
-from PIL import Image  # type: ignore[import]
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image, ImageOps  # type: ignore[import]
+from .scanner import ScanStats, map_folders
+from .journal import BACKGROUND_REMOVED, Journal, fingerprint
+from .my_secrets import get_secrets
+from .encoder import save_jpeg
+from . import bg_model, masks
 
-
-def importer():
-    """
-    This import is really slow when loading the app. Importing it either inside the function that
-    uses it or in a different thread feels like it makes for a better user experience.
-    """
-    global bg
-    # from rembg import bg  # type: ignore[import]
-
-
-imp_th = threading.Thread(target=importer)
-imp_th.start()
+# The color removed backgrounds are replaced with.
+FILL_COLOR = (255, 255, 255)
 
 
 def main() -> int:
@@ -30,12 +26,84 @@ def main() -> int:
     return 0
 
 
+def composite(
+    rgb: np.ndarray,
+    alpha: np.ndarray,
+    fill_color: tuple = FILL_COLOR,
+    rows: int = 256,
+) -> np.ndarray:
+    """
+    This function will blend an RGB (uint8) image over a solid fill_color using alpha (uint8,
+    same height and width) in a single vectorized pass. It returns an RGB uint8 image. Rows are
+    blended a few (rows) at a time, so the uint16 intermediates stay small.
+    """
+    output = np.empty(rgb.shape, dtype=np.uint8)
+    fill = np.asarray(fill_color, dtype=np.uint16)
+    for top in range(0, rgb.shape[0], rows):
+        band = slice(top, top + rows)
+        band_alpha = alpha[band, :, None].astype(np.uint16)
+        # 255 * 255 + 127 still fits in uint16.
+        blended = rgb[band] * band_alpha
+        np.subtract(255, band_alpha, out=band_alpha)
+        blended += fill * band_alpha
+        blended += 127
+        blended //= 255
+        output[band] = blended
+    return output
+
+
+def foreground_and_alpha(
+    image: Image.Image,
+    model_name: str | None = None,
+    alpha_matting: bool = True,
+    image_hash: str | None = None,
+    fast: bool | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    This function will segment an RGB image (see bg_model.segment for fast and image_hash, which
+    enables the mask cache) and return its foreground's colors (the image itself, or the estimated
+    foreground when alpha matting) and alpha (uint8 arrays). Nothing is encoded/decoded as PNG.
+    In fast mode, the mask's boundary is already refined at full resolution, so alpha matting is
+    skipped. Alpha matting ("alpha_matting_method" in the secrets file) solves only the band
+    around the mask's boundary by default ("band", see masks.band_matting, its width and quality
+    are "matting_band_width" and "matting_iterations"), "rembg" runs rembg's (whole image) one.
+    """
+    secrets = get_secrets()
+    if fast is None:
+        fast = secrets.get("fast_segmentation", False)
+    mask = bg_model.segment(image, model_name, image_hash, fast)
+    if not alpha_matting or fast:
+        return np.asarray(image), mask
+
+    if secrets.get("alpha_matting_method", "band") == "band":
+        return masks.band_matting(
+            image,
+            mask,
+            secrets.get("matting_band_width", 10),
+            iterations=secrets.get("matting_iterations", 2),
+        )
+
+    from rembg import bg  # type: ignore[import]
+
+    # rembg's default thresholds (foreground, background) and erosion size.
+    cutout = np.asarray(
+        bg.alpha_matting_cutout(image, Image.fromarray(mask), 240, 10, 10)
+    )
+    return cutout[..., :3], cutout[..., 3]
+
+
 def rm_bg(
-    img_path: str, model_name: str = "u2net_human_seg", alpha_matting: bool = True
+    img_path: str,
+    model_name: str | None = None,
+    alpha_matting: bool = True,
+    fill_color: tuple = FILL_COLOR,
+    fast: bool | None = None,
 ) -> None:
     """
     This function will remove the background of a given image. It should receive a JPG image path.
-    It will create and save a JPG image with white background.
+    It will create and save a JPG image with the background replaced by fill_color (white). The
+    model defaults to bg_model.default_model, masks are cached and fast selects the fast
+    segmentation mode (see bg_model.segment).
     """
 
     # Making sure we got the correct input.
@@ -46,58 +114,141 @@ def rm_bg(
     # Replacing "\" to "/" because *Windows*.
     img_path = img_path.replace("\\", "/")
 
-    # Opening/reading image as bytes.
+    # Opening/reading image as bytes (its hash identifies its cached mask).
     with open(img_path, "rb") as input_as_bytes:
         input_img = input_as_bytes.read()
-
-    # Removing background from image using u2net_human_seg.
-    output_as_bytes = bg.remove(
-        input_img, alpha_matting=alpha_matting, model_name=model_name
+    with Image.open(io.BytesIO(input_img)) as image:
+        # Rotated photos are turned upright before segmenting them (like rembg does).
+        image = ImageOps.exif_transpose(image).convert("RGB")
+
+    # Removing background from image using u2net_human_seg (or the configured model) and
+    # replacing it with the fill color.
+    rgb, alpha = foreground_and_alpha(
+        image, model_name, alpha_matting, bg_model.content_hash(input_img), fast
     )
-    # Converting the output as bytes to a PIL Image.
-    pil_img = Image.open(io.BytesIO(output_as_bytes))
-
-    # Tuple representing the new RGB background color (the image we get from rembg is a transparent
-    # PNG).
-    fill_color = (255, 255, 255)
-    pil_img = pil_img.convert("RGBA")
-    if pil_img.mode in ("RGBA", "LA"):
-        # Removing transparency and making background white.
-        background = Image.new(pil_img.mode[:-1], pil_img.size, fill_color)
-        background.paste(pil_img, pil_img.split()[-1])  # omit transparency
-        pil_img = background
+    output = composite(rgb, alpha, fill_color)
 
     # Saving the new image in the same folder with a similar name.
-    pil_img.convert("RGB").save(img_path[:dot_pos] + "_NO_BG.jpg")
+    save_jpeg(output, img_path[:dot_pos] + "_NO_BG.jpg")
+
+
+def list_folder_images(folder: str) -> list | None:
+    """
+    This function will return the images of a folder whose background should be removed (the
+    ones starting with number 1 through 3), creating its "FACES_BG" subfolder if needed. It
+    returns None if folder isn't a folder.
+    """
+    if not os.path.isdir(folder):
+        return None
+    # Checking for the existence of a "backup" folder called "FACES_BG".
+    if not os.path.exists(backup_dir := folder + "/FACES_BG"):
+        # Creating the subfolder if it doesn't exist.
+        os.mkdir(backup_dir)
+
+    # Getting the images in the current subfolder.
+    # Images with background already removed will end in "_NO_BG". So, ignoring "G" in the end
+    # of their names will ignore those images (we don't want to remove the background twice).
+    return glob(folder + "/[1-3]*[!G].jpg")
+
+
+def remove_image_background(folder: str, input_path: str) -> None:
+    """
+    This function will remove the background of one of a folder's images and move the original
+    to its "FACES_BG" subfolder.
+    """
+    # Replacing "\" to "/" because *Windows*.
+    input_path = input_path.replace("\\", "/")
+    # Removing background of this image.
+    rm_bg(input_path)
+    # Moving the original image to the "backup folder".
+    shutil.move(input_path, folder + "/FACES_BG/" + input_path.split("/")[-1])
+
+
+def remove_backgrounds(
+    listings: list, journal: Journal | None = None, workers: int | None = None
+) -> list[tuple[str, str]]:
+    """
+    This function will remove the background of the images of many folders, given as (folder,
+    image paths) tuples. Workers (bg_model.workers, by default) images are processed at the same
+    time, no matter which folder they are from, so reading, decoding and encoding some images
+    overlaps with the inference of others. Each folder's result is recorded in the journal. It
+    returns the (folder, error) of the folders that failed.
+    """
+    journal = journal if journal is not None else Journal()
+    workers = workers if workers is not None else bg_model.workers()
+    listings = [(folder, imgs_paths) for folder, imgs_paths in listings if imgs_paths]
+    # The images are moved as they are processed, so fingerprints are taken beforehand.
+    fingerprints = [fingerprint(imgs_paths) for _, imgs_paths in listings]
+
+    failures = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            [
+                executor.submit(remove_image_background, folder, input_path)
+                for input_path in imgs_paths
+            ]
+            for folder, imgs_paths in listings
+        ]
+        for (folder, _), folder_fingerprint, folder_futures in zip(
+            listings, fingerprints, futures
+        ):
+            errors = [
+                str(err) or type(err).__name__
+                for future in folder_futures
+                if (err := future.exception()) is not None
+            ]
+            error = errors[0] if errors else ""
+            journal.record(
+                folder,
+                os.path.basename(folder),
+                BACKGROUND_REMOVED,
+                folder_fingerprint,
+                error,
+            )
+            if error:
+                failures.append((folder, error))
+    return failures
+
+
+def remove_folder_background(
+    folder: str,
+    imgs_paths: list | None = None,
+    journal: Journal | None = None,
+    workers: int | None = None,
+) -> None:
+    """
+    This function will remove the background of a folder's images (imgs_paths, defaults to
+    list_folder_images), moving the originals to its "FACES_BG" subfolder (see
+    remove_backgrounds). It raises RuntimeError if any image fails.
+    """
+    if imgs_paths is None:
+        imgs_paths = list_folder_images(folder) or []
+    if failures := remove_backgrounds([(folder, imgs_paths)], journal, workers):
+        raise RuntimeError(failures[0][1])
 
 
-def rm_bg_from_folder(imgs_folder: str) -> None:
+def rm_bg_from_folder(imgs_folder: str, stats: ScanStats | None = None) -> None:
     """
     This function will remove the background of images starting with number 1 through 3
-    in all subfolders of a given imgs_folder.
+    in all subfolders of a given imgs_folder (see remove_backgrounds). Subfolders are listed
+    concurrently, with their timings added to stats. It raises RuntimeError if any subfolder
+    fails (after processing all of them).
     """
     # Getting subfolders of the current folder.
     folder_paths = glob(imgs_folder + "/*")
 
-    # Iterating through each subfolder.
-    for folder in folder_paths:
-        # Checking for the existence of a "backup" folder called "FACES_BG".
-        if not os.path.exists(backup_dir := folder + "/FACES_BG"):
-            # Creating the subfolder if it doesn't exist.
-            os.mkdir(backup_dir)
-
-        # Getting the images in the current subfolder.
-        # Images with background already removed will end in "_NO_BG". So, ignoring "G" in the end
-        # of their names will ignore those images (we don't want to remove the background twice).
-        imgs_paths = glob(folder + "/[1-3]*[!G].jpg")
-        # Iterating through the images in this subfolder.
-        for input_path in imgs_paths:
-            # Replacing "\" to "/" because *Windows*.
-            input_path = input_path.replace("\\", "/")
-            # Removing background of this image.
-            rm_bg(input_path)
-            # Moving the original image to the "backup folder".
-            shutil.move(input_path, backup_dir + "/" + input_path.split("/")[-1])
+    listings = [
+        (folder, imgs_paths)
+        for folder, imgs_paths in zip(
+            folder_paths, map_folders(list_folder_images, folder_paths, stats)
+        )
+        if imgs_paths is not None
+    ]
+    if failures := remove_backgrounds(listings):
+        raise RuntimeError(
+            f"Failed to remove the backgrounds of {len(failures)} folder(s): "
+            + ", ".join(f"{folder} ({error})" for folder, error in failures)
+        )
 
 
 if __name__ == "__main__":
@@ -3,7 +3,7 @@ Short image processing functions.
 """
 
 from typing import Union
-from PIL import Image, ImageTk  # type: ignore[import]
+from PIL import Image  # type: ignore[import]
 
 
 def load_img(path, size: Union[tuple[int], float] = None):
@@ -14,6 +14,8 @@ def load_img(path, size: Union[tuple[int], float] = None):
         A float, for indicating a percentage to resize; or
         None, to keep original size.
     """
+    # Only the GUI needs ImageTk (and tkinter): the CLI and the worker processes import this too.
+    from PIL import ImageTk  # type: ignore[import]  # pylint: disable=import-outside-toplevel
 
     if size is None:
         return ImageTk.PhotoImage(Image.open(path))
@@ -27,3 +29,22 @@ def load_img(path, size: Union[tuple[int], float] = None):
         return ImageTk.PhotoImage(img.resize(new_size))
 
     raise ValueError("Expected size to be either a tuple of ints, a float or None.")
+
+
+def downscale(image: Image.Image, max_side: int) -> Image.Image:
+    """
+    This function will return a copy of image whose largest side is at most max_side (or image
+    itself, if it's small enough already).
+    """
+    if max(image.size) <= max_side:
+        return image
+    # Shrinking by a whole factor first is a lot faster than resampling everything.
+    factor = max(image.size) // max_side
+    small = image.reduce(factor) if factor >= 2 else image
+    if max(small.size) > max_side:
+        scale = max_side / max(small.size)
+        small = small.resize(
+            (round(small.width * scale), round(small.height * scale)),
+            Image.Resampling.BILINEAR,
+        )
+    return small
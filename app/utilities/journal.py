@@ -0,0 +1,149 @@
+"""
+This module implements the batch jobs' journal (an SQLite database). It keeps the last result of
+each stage (renamed, background removed, assembled, uploaded) of each patient folder, along with
+a fingerprint of that stage's inputs. Restarted batches can then skip what was already done (as
+long as its inputs didn't change) and retry only what failed.
+"""
+
+import os
+import time
+import hashlib
+import sqlite3
+from contextlib import closing, contextmanager
+from fnmatch import fnmatch
+from .paths import join_pr
+
+RENAMED = "renamed"
+BACKGROUND_REMOVED = "background_removed"
+ASSEMBLED = "assembled"
+UPLOADED = "uploaded"
+
+DONE = "done"
+FAILED = "failed"
+
+
+def fingerprint(paths) -> str:
+    """
+    This function will return a fingerprint of some files' names, sizes and modification times.
+    Missing files are ignored.
+    """
+    digest = hashlib.sha1()
+    for path in sorted(paths):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        digest.update(
+            f"{os.path.basename(path)}|{stat.st_size}|{stat.st_mtime_ns}\n".encode()
+        )
+    return digest.hexdigest()
+
+
+def photos_fingerprint(path: str) -> str:
+    """
+    This function will return the fingerprint of a patient folder's photos (including the ones
+    in its "OBJETIVA" subfolder).
+    """
+    photos = []
+    for folder in (path, os.path.join(path, "OBJETIVA")):
+        try:
+            with os.scandir(folder) as entries:
+                photos.extend(
+                    entry.path for entry in entries if fnmatch(entry.name, "*MG*.jpg")
+                )
+        except FileNotFoundError:
+            continue
+    return fingerprint(photos)
+
+
+class Journal:
+    """
+    The batch jobs' journal, stored in db_path.
+    """
+
+    def __init__(self, db_path: str | None = None):
+        self.db_path = db_path or join_pr("resources", "journal.sqlite3")
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with closing(self._connect()) as connection, connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS stages (
+                    path TEXT NOT NULL,
+                    patient_id TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    error TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (path, stage)
+                )
+                """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def is_done(self, path: str, stage: str, input_fingerprint: str) -> bool:
+        """
+        This function will check whether a folder's stage was done with the same inputs.
+        """
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                "SELECT status, fingerprint FROM stages WHERE path = ? AND stage = ?",
+                (path, stage),
+            ).fetchone()
+        return row == (DONE, input_fingerprint)
+
+    def record(
+        self,
+        path: str,
+        patient_id: str,
+        stage: str,
+        input_fingerprint: str,
+        error: str = "",
+    ) -> None:
+        """
+        This function will record a stage's result (failed if there's an error, done otherwise).
+        """
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO stages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    path,
+                    patient_id,
+                    stage,
+                    FAILED if error else DONE,
+                    input_fingerprint,
+                    error,
+                    time.time(),
+                ),
+            )
+
+    @contextmanager
+    def stage(self, path: str, patient_id: str, stage: str, input_fingerprint: str):
+        """
+        This context manager will record a stage as done if its block finishes, or as failed
+        (and re-raise the error) if it raises.
+        """
+        try:
+            yield
+        except Exception as err:
+            self.record(
+                path,
+                patient_id,
+                stage,
+                input_fingerprint,
+                str(err) or type(err).__name__,
+            )
+            raise
+        self.record(path, patient_id, stage, input_fingerprint)
+
+    def failed(self, stage: str) -> list[tuple[str, str, str]]:
+        """
+        This function will return the (path, patient id, error) of every folder whose last try
+        of a given stage failed.
+        """
+        with closing(self._connect()) as connection:
+            return connection.execute(
+                "SELECT path, patient_id, error FROM stages WHERE stage = ? AND status = ? "
+                "ORDER BY updated_at",
+                (stage, FAILED),
+            ).fetchall()
@@ -0,0 +1,156 @@
+"""
+This module implements template layouts. A layout is a JSON file (see "layouts/default.json")
+describing the canvas, the patient's header box and each photo slot. Layouts are validated and
+compiled into a slot table once (per process) and then reused by every assembly.
+"""
+
+import os
+import json
+from dataclasses import dataclass
+from functools import lru_cache
+from .paths import join_pr
+
+
+@dataclass(frozen=True)
+class Box:
+    """
+    A rectangle inside the canvas.
+    """
+
+    x: int
+    y: int
+    width: int
+    height: int
+
+    @property
+    def size(self) -> tuple[int, int]:
+        """(width, height), as expected by PIL."""
+        return self.width, self.height
+
+    @property
+    def region(self) -> tuple[slice, slice]:
+        """(rows, columns) slices, as expected by numpy."""
+        return slice(self.y, self.y + self.height), slice(self.x, self.x + self.width)
+
+    def overlaps(self, other: "Box") -> bool:
+        """Whether this box and other share any pixel."""
+        return (
+            self.x < other.x + other.width
+            and other.x < self.x + self.width
+            and self.y < other.y + other.height
+            and other.y < self.y + self.height
+        )
+
+
+@dataclass(frozen=True)
+class Slot(Box):
+    """
+    A photo slot. Position is the number the patient's photo starts with (e.g. "1_IMG_1234.jpg").
+    """
+
+    position: int = 0
+    name: str = ""
+
+
+@dataclass(frozen=True)
+class Layout:
+    """
+    A compiled (validated) template layout.
+    """
+
+    name: str
+    background: str
+    canvas: tuple[int, int]
+    header: Box
+    slots: tuple[Slot, ...]
+
+    def check_canvas(self, shape: tuple) -> None:
+        """
+        This function will make sure the header and every slot fit in an image of a given
+        (numpy) shape, raising ValueError otherwise.
+        """
+        height, width = shape[:2]
+        for box in (self.header, *self.slots):
+            if box.x + box.width > width or box.y + box.height > height:
+                raise ValueError(
+                    f"Layout {self.name}: {box} doesn't fit in a {width}x{height} template."
+                )
+
+
+def _box(data: dict, kind: type = Box, **extra) -> Box:
+    try:
+        box = kind(
+            x=int(data["x"]),
+            y=int(data["y"]),
+            width=int(data["width"]),
+            height=int(data["height"]),
+            **extra,
+        )
+    except (KeyError, TypeError, ValueError) as err:
+        raise ValueError(f"Invalid box in layout: {data}") from err
+    if box.x < 0 or box.y < 0 or box.width <= 0 or box.height <= 0:
+        raise ValueError(f"Invalid box in layout: {data}")
+    return box
+
+
+def compile_layout(data: dict, name: str = "") -> Layout:
+    """
+    This function will validate a layout description (the JSON file's contents) and compile it
+    into a Layout. It raises ValueError if anything is wrong with it.
+    """
+    try:
+        canvas = (int(data["canvas"]["width"]), int(data["canvas"]["height"]))
+        header = _box(data["header"])
+        slots = tuple(
+            sorted(
+                (
+                    _box(
+                        slot,
+                        Slot,
+                        position=int(slot["position"]),
+                        name=slot.get("name", ""),
+                    )
+                    for slot in data["slots"]
+                ),
+                key=lambda slot: slot.position,
+            )
+        )
+    except (KeyError, TypeError) as err:
+        raise ValueError(f"Layout {name}: missing or invalid {err}.") from err
+
+    if len(slots) == 0:
+        raise ValueError(f"Layout {name}: expected at least one slot.")
+    if [slot.position for slot in slots] != list(range(1, len(slots) + 1)):
+        raise ValueError(
+            f"Layout {name}: slot positions should be 1 through {len(slots)}."
+        )
+
+    boxes = (header, *slots)
+    for i, box in enumerate(boxes):
+        if box.x + box.width > canvas[0] or box.y + box.height > canvas[1]:
+            raise ValueError(f"Layout {name}: {box} is outside the canvas.")
+        for other in boxes[i + 1 :]:
+            if box.overlaps(other):
+                raise ValueError(f"Layout {name}: {box} overlaps {other}.")
+
+    return Layout(
+        name=name,
+        background=join_pr(
+            "images", "templates", data.get("background", "template.jpg")
+        ),
+        canvas=canvas,
+        header=header,
+        slots=slots,
+    )
+
+
+@lru_cache(maxsize=None)
+def load_layout(name: str = "default") -> Layout:
+    """
+    This function will load and compile a layout. Name can either be a layout's name (a file in
+    the "layouts" folder, without ".json") or a path to a layout file. Compiled layouts are cached.
+    """
+    path = name if os.path.isfile(name) else join_pr("layouts", f"{name}.json")
+    with open(path, encoding="utf-8") as layout_file:
+        data = json.load(layout_file)
+    return compile_layout(data, os.path.splitext(os.path.basename(path))[0])
@@ -0,0 +1,241 @@
+"""
+This module implements working with background removal masks at full resolution without paying
+for the whole image. Camera photos are much bigger than what the model sees (U²-Net works at
+320x320), so a mask can be computed from a reduced copy of a photo and upsampled: only the narrow
+band around the subject's boundary needs full resolution detail, and it is refined with a guided
+filter (edges follow the photo's own edges) computed tile by tile, only where the band is.
+Alpha matting works the same way: only the unknown band around the mask's boundary is solved.
+"""
+
+import numpy as np
+from PIL import Image  # type: ignore[import]
+
+
+def box_filter(pixels: np.ndarray, radius: int) -> np.ndarray:
+    """
+    This function will return the mean of each pixel's (2 * radius + 1) square neighborhood
+    (over the last two axes, so many tiles can be filtered at once), using an integral image (so
+    it costs the same for any radius). Borders repeat the edge pixels.
+    """
+    side = 2 * radius + 1
+    pad = [(0, 0)] * (pixels.ndim - 2) + [(radius + 1, radius), (radius + 1, radius)]
+    integral = np.pad(pixels.astype(np.float32), pad, mode="edge")
+    integral = integral.cumsum(axis=-2).cumsum(axis=-1)
+    return (
+        integral[..., side:, side:]
+        - integral[..., :-side, side:]
+        - integral[..., side:, :-side]
+        + integral[..., :-side, :-side]
+    ) / side**2
+
+
+def guided_filter(
+    guide: np.ndarray, source: np.ndarray, radius: int, eps: float = 1e-3
+) -> np.ndarray:
+    """
+    This function will smooth source (floats in [0, 1]) following the edges of guide (a
+    grayscale image, floats in [0, 1]): He et al.'s guided filter. Smaller eps keeps more of the
+    guide's edges.
+    """
+    mean_guide = box_filter(guide, radius)
+    mean_source = box_filter(source, radius)
+    covariance = box_filter(guide * source, radius) - mean_guide * mean_source
+    variance = box_filter(guide * guide, radius) - mean_guide * mean_guide
+    scale = covariance / (variance + eps)
+    offset = mean_source - scale * mean_guide
+    return box_filter(scale, radius) * guide + box_filter(offset, radius)
+
+
+def boundary_tiles(band: np.ndarray, tile: int, grow: bool = False) -> np.ndarray:
+    """
+    This function will return the (row, column) indexes of the tile x tile tiles that contain
+    any pixel of band (a boolean array). If grow is set, their neighbors are included too (for
+    bands that will be widened by up to tile pixels).
+    """
+    height, width = band.shape
+    rows, columns = -(-height // tile), -(-width // tile)
+    padded = np.zeros((rows * tile, columns * tile), dtype=bool)
+    padded[:height, :width] = band
+    grid = padded.reshape(rows, tile, columns, tile).any(axis=(1, 3))
+    if grow:
+        grid = box_filter(grid, 1) > 0.5 / 9
+    return np.argwhere(grid)
+
+
+def _tile_crops(tiles: np.ndarray, tile: int, margin: int) -> tuple:
+    # Indexes of the tiles (with margin pixels around them) in arrays padded by _pad_for_tiles.
+    side = np.arange(tile + 2 * margin)
+    return (
+        tiles[:, 0, None, None] * tile + side[:, None],
+        tiles[:, 1, None, None] * tile + side[None, :],
+    )
+
+
+def _pad_for_tiles(
+    pixels: np.ndarray, tile: int, margin: int, mode="edge"
+) -> np.ndarray:
+    pad = [(margin, margin + tile), (margin, margin + tile)] + [(0, 0)] * (
+        pixels.ndim - 2
+    )
+    return np.pad(pixels, pad, mode=mode)
+
+
+def _write_tiles(
+    output: np.ndarray, tiles: np.ndarray, tile: int, values: np.ndarray, selected
+) -> None:
+    # Writes values (tiles without their margins) wherever selected, inside output's bounds.
+    height, width = output.shape[:2]
+    shape = selected.shape
+    rows = np.broadcast_to(
+        tiles[:, 0, None, None] * tile + np.arange(tile)[:, None], shape
+    )
+    columns = np.broadcast_to(
+        tiles[:, 1, None, None] * tile + np.arange(tile)[None, :], shape
+    )
+    # Tiles on the right/bottom edges may go past the image.
+    selected = selected & (rows < height) & (columns < width)
+    output[rows[selected], columns[selected]] = values[selected]
+
+
+def upsample_and_refine(
+    image: Image.Image,
+    small_mask: np.ndarray,
+    radius: int | None = None,
+    eps: float = 1e-3,
+    tile: int = 64,
+) -> np.ndarray:
+    """
+    This function will upsample a mask computed from a reduced copy of image to image's size and
+    refine the band around its boundary (partially transparent pixels, widened by radius) with a
+    guided filter. Radius defaults to the scale factor between both (at least 2). The band's
+    tiles are stacked and filtered all at once. It returns a uint8 mask.
+    """
+    scale = image.width / small_mask.shape[1]
+    radius = radius if radius is not None else max(2, round(scale))
+    mask = np.array(
+        Image.fromarray(small_mask).resize(image.size, Image.Resampling.BILINEAR)
+    )
+    band = (mask > 0) & (mask < 255)
+    tiles = boundary_tiles(band, tile)
+    if scale <= 1 or len(tiles) == 0:
+        return mask
+
+    # The filter needs some context around each tile.
+    margin = 2 * radius
+    crops = _tile_crops(tiles, tile, margin)
+    inner = (slice(None), slice(margin, -margin), slice(margin, -margin))
+    gray = _pad_for_tiles(np.asarray(image.convert("L")), tile, margin)[crops]
+    source = _pad_for_tiles(mask, tile, margin)[crops]
+
+    refined = guided_filter(
+        gray.astype(np.float32) / 255, source.astype(np.float32) / 255, radius, eps
+    )[inner]
+    # Only the band (widened by radius) changes, everything else stays as upsampled.
+    near_band = _pad_for_tiles(band, tile, margin, "constant")[crops]
+    selected = box_filter(near_band, radius)[inner] > 0.5 / (2 * radius + 1) ** 2
+    refined = np.clip(refined * 255 + 0.5, 0, 255).astype(np.uint8)
+    _write_tiles(mask, tiles, tile, refined, selected)
+    return mask
+
+
+def band_matting(
+    image: Image.Image,
+    mask: np.ndarray,
+    band_width: int = 10,
+    radius: int | None = None,
+    iterations: int = 2,
+    smoothing: int = 1,
+    thresholds: tuple[int, int] = (10, 240),
+    tile: int = 64,
+    chunk: int = 16,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    This function will alpha matte image around mask's boundary. The trimap comes from the mask:
+    pixels at most band_width away from its boundary (or partially transparent, between
+    thresholds) are unknown, the others are foreground/background. Only the unknown band is
+    solved: each unknown pixel's alpha is its color's projection between the mean foreground and
+    background colors around it (radius pixels, 2 * band_width by default). Each of the
+    iterations (more is slower, but better) adds the band's pixels solved as (almost) pure
+    foreground/background to those means. Alphas are then smoothed following the image's edges
+    (a guided filter, smoothing pixels around, 0 disables it) and pixels without both known
+    colors around keep the mask's alpha. Tiles are solved chunk at a time. It returns the
+    foreground's colors (the image's colors, except in the band) and alpha (uint8 arrays).
+    """
+    radius = radius if radius is not None else 2 * band_width
+    pixels = np.asarray(image)
+    foreground = pixels.copy()
+    alpha = mask.copy()
+
+    hard = mask >= 128
+    boundary = (mask > thresholds[0]) & (mask < thresholds[1])
+    boundary[:, 1:] |= hard[:, 1:] != hard[:, :-1]
+    boundary[1:] |= hard[1:] != hard[:-1]
+    tiles = boundary_tiles(boundary, tile, grow=band_width > 0)
+    if len(tiles) == 0:
+        return foreground, alpha
+
+    # Solving needs known pixels around the band.
+    margin = band_width + radius
+    inner = (slice(None), slice(margin, -margin), slice(margin, -margin))
+    padded_pixels = _pad_for_tiles(pixels, tile, margin)
+    padded_hard = _pad_for_tiles(hard, tile, margin)
+    padded_mask = _pad_for_tiles(mask, tile, margin)
+    padded_boundary = _pad_for_tiles(boundary, tile, margin, "constant")
+    for start in range(0, len(tiles), chunk):
+        chunk_tiles = tiles[start : start + chunk]
+        crops = _tile_crops(chunk_tiles, tile, margin)
+        colors = np.moveaxis(padded_pixels[crops], -1, 1).astype(np.float32) / 255
+        unknown = (
+            box_filter(padded_boundary[crops], band_width)
+            > 0.5 / (2 * band_width + 1) ** 2
+        )
+        known_foreground = (~unknown & padded_hard[crops]).astype(np.float32)
+        known_background = (~unknown & ~padded_hard[crops]).astype(np.float32)
+        prior = padded_mask[crops].astype(np.float32) / 255
+
+        matte = known_foreground
+        weights = (known_foreground, known_background)
+        for _ in range(max(1, iterations)):
+            means = []
+            for weight in weights:
+                total = box_filter(weight, radius)
+                mean = box_filter(colors * weight[:, None], radius)
+                mean /= np.maximum(total, 1e-6)[:, None]
+                means.append((mean, total > 1e-6))
+            (fg_mean, has_fg), (bg_mean, has_bg) = means
+            difference = fg_mean - bg_mean
+            solved = np.clip(
+                ((colors - bg_mean) * difference).sum(axis=1)
+                / ((difference * difference).sum(axis=1) + 1e-4),
+                0,
+                1,
+            )
+            # Without both known colors around, the mask is the best guess left.
+            solved = np.where(has_fg & has_bg, solved, prior)
+            matte = np.where(unknown, solved, known_foreground)
+            weights = (
+                known_foreground + unknown * (matte > 0.95),
+                known_background + unknown * (matte < 0.05),
+            )
+        if smoothing > 0:
+            # Noise makes neighbors' alphas jitter: a guided filter keeps the image's edges only.
+            smooth = guided_filter(colors.mean(axis=1), matte, smoothing, 1e-3)
+            matte = np.where(unknown, np.clip(smooth, 0, 1), matte)
+
+        # The foreground's colors: the mean foreground color plus what the model can't explain.
+        estimate = fg_mean + (
+            colors - (matte[:, None] * fg_mean + (1 - matte[:, None]) * bg_mean)
+        )
+        estimate = np.moveaxis(np.clip(estimate * 255 + 0.5, 0, 255), 1, -1)
+        selected = unknown[inner]
+        _write_tiles(
+            alpha,
+            chunk_tiles,
+            tile,
+            np.clip(matte[inner] * 255 + 0.5, 0, 255).astype(np.uint8),
+            selected,
+        )
+        _write_tiles(
+            foreground, chunk_tiles, tile, estimate[inner].astype(np.uint8), selected
+        )
+    return foreground, alpha
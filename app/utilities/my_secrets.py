@@ -29,6 +29,45 @@ def get_secrets() -> dict:
             "api_link": "",
             "patient_id_key": "",
             "files": "",
+            "assemble_workers": 2,
+            "decode_workers": None,
+            "layout": "default",
+            "fast_decode": True,
+            "slot_cache_mb": 1024,
+            "template_cache_mb": 256,
+            "jpeg_encoder": {
+                "quality": 75,
+                "subsampling": "4:2:0",
+                "progressive": False,
+                "optimize": True,
+            },
+            "api_timeout": 30,
+            "api_retries": 3,
+            "api_connections": 8,
+            "patient_cache_ttl": 600,
+            "upload_concurrency": 4,
+            "upload_rate": 0,
+            "upload_retries": 2,
+            "scan_workers": 8,
+            "watch_folders": False,
+            "watch_settle_seconds": 2,
+            "auto_assemble": False,
+            "rembg_model": "u2net_human_seg",
+            "rembg_workers": 2,
+            "rembg_threads": 0,
+            "mask_cache_mb": 512,
+            "fast_segmentation": False,
+            "fast_segmentation_size": 1024,
+            "alpha_matting_method": "band",
+            "matting_band_width": 10,
+            "matting_iterations": 2,
+            "pipeline_queue_size": 4,
+            "pipeline_workers": {
+                "rename": 4,
+                "background": 1,
+                "assemble": 2,
+                "upload": 4,
+            },
         }
         if not os.path.exists(folder_path := join_pr("resources")):
             os.mkdir(folder_path)
@@ -0,0 +1,204 @@
+"""
+This module implements processing patient folders as a stream: rename -> remove backgrounds ->
+assemble -> upload. Each stage has its own worker threads and stages are connected by bounded
+queues, so a patient is uploaded as soon as its template is ready (instead of waiting for the
+whole batch) and a slow stage holds back the ones before it instead of piling up work. The time
+each stage spends blocked on a full queue (backpressure) or waiting on an empty one (starvation)
+is measured, to tell which stage is the bottleneck.
+"""
+
+import time
+import queue
+import threading
+from dataclasses import dataclass, field
+from typing import Callable
+import numpy as np
+from .my_secrets import get_secrets
+from .layout import Layout
+from .journal import ASSEMBLED, Journal, photos_fingerprint
+from . import commands, folders, im_bg, uploader
+
+# Tells a stage's worker there's nothing left to process.
+_DONE = object()
+
+
+@dataclass
+class StageStats:
+    """
+    Timings of a pipeline stage. busy_seconds is the time spent processing (from all workers),
+    blocked_seconds the time spent waiting for room in the next stage's queue (backpressure) and
+    starved_seconds the time spent waiting for something to process.
+    """
+
+    name: str
+    workers: int = 1
+    done: int = 0
+    failed: int = 0
+    busy_seconds: float = 0.0
+    blocked_seconds: float = 0.0
+    starved_seconds: float = 0.0
+    max_queued: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, name: str, seconds: float) -> None:
+        """
+        This function will add seconds to one of the timings ("busy", "blocked" or "starved").
+        """
+        with self._lock:
+            setattr(self, f"{name}_seconds", getattr(self, f"{name}_seconds") + seconds)
+
+    def count(self, error: str) -> None:
+        """
+        This function will count a processed patient (as failed if there's an error).
+        """
+        with self._lock:
+            if error:
+                self.failed += 1
+            else:
+                self.done += 1
+
+    def report(self) -> str:
+        """
+        A one line summary of this stage.
+        """
+        return (
+            f"{self.name}: {self.done} done, {self.failed} failed, {self.workers} worker(s), "
+            f"busy {self.busy_seconds:.2f}s, blocked {self.blocked_seconds:.2f}s, "
+            f"starved {self.starved_seconds:.2f}s, up to {self.max_queued} queued."
+        )
+
+
+@dataclass
+class Stage:
+    """
+    A pipeline stage: func is called with each (folder path, patient id) and should raise if it
+    fails (failed patients don't go through the next stages).
+    """
+
+    name: str
+    func: Callable[[str, str], None]
+    workers: int = 1
+
+
+def run_pipeline(
+    paths_and_ids: list,
+    stages: list[Stage],
+    queue_size: int | None = None,
+    on_result: Callable[[str, str, str, str], None] | None = None,
+) -> list[StageStats]:
+    """
+    This function will stream a list of (folder path, patient id) tuples through stages. Each
+    stage's queue holds at most queue_size patients ("pipeline_queue_size" in the secrets file).
+    on_result is called (from the stage's worker) with the stage's name, folder path, patient id
+    and an error message (empty if it worked) every time a stage finishes a patient. It returns
+    each stage's StageStats.
+    """
+    if queue_size is None:
+        queue_size = get_secrets().get("pipeline_queue_size", 4)
+    queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in stages]
+    all_stats = [StageStats(stage.name, max(1, stage.workers)) for stage in stages]
+
+    def work(index: int) -> None:
+        stage, stats, inbox = stages[index], all_stats[index], queues[index]
+        outbox = queues[index + 1] if index + 1 < len(queues) else None
+        while True:
+            start = time.perf_counter()
+            item = inbox.get()
+            stats.add("starved", time.perf_counter() - start)
+            if item is _DONE:
+                return
+
+            path, patient_id = item
+            start = time.perf_counter()
+            try:
+                stage.func(path, patient_id)
+            except Exception as err:  # pylint: disable=broad-except
+                error = str(err) or type(err).__name__
+            else:
+                error = ""
+            stats.add("busy", time.perf_counter() - start)
+            stats.count(error)
+            if on_result is not None:
+                on_result(stage.name, path, patient_id, error)
+
+            if not error and outbox is not None:
+                start = time.perf_counter()
+                outbox.put(item)
+                stats.add("blocked", time.perf_counter() - start)
+                next_stats = all_stats[index + 1]
+                next_stats.max_queued = max(next_stats.max_queued, outbox.qsize())
+
+    threads = [
+        [
+            threading.Thread(target=work, args=(index,), daemon=True)
+            for _ in range(all_stats[index].workers)
+        ]
+        for index in range(len(stages))
+    ]
+    for stage_threads in threads:
+        for thread in stage_threads:
+            thread.start()
+
+    for item in paths_and_ids:
+        queues[0].put(item)
+        all_stats[0].max_queued = max(all_stats[0].max_queued, queues[0].qsize())
+    # Once a stage's workers are done, the next stage won't get anything else.
+    for index, stage_threads in enumerate(threads):
+        for _ in stage_threads:
+            queues[index].put(_DONE)
+        for thread in stage_threads:
+            thread.join()
+    return all_stats
+
+
+def default_stages(
+    template: np.ndarray,
+    layout: Layout,
+    fast_decode: bool = True,
+    remove_background: bool = False,
+    upload: bool = True,
+    workers: dict | None = None,
+) -> list[Stage]:
+    """
+    This function will return the usual stages: rename -> remove backgrounds (optional) ->
+    assemble -> upload (optional), all of them recording their results in the journal. Workers
+    maps stage names to their amount of workers ("pipeline_workers" in the secrets file).
+    """
+    secrets = get_secrets()
+    workers = {
+        "rename": 4,
+        "background": 1,
+        "assemble": secrets.get("assemble_workers", 2),
+        "upload": secrets.get("upload_concurrency", 4),
+        **secrets.get("pipeline_workers", {}),
+        **(workers or {}),
+    }
+    journal = Journal()
+
+    def rename_stage(path: str, _: str) -> None:
+        folders.rename_folder(path, journal)
+
+    def background_stage(path: str, _: str) -> None:
+        im_bg.remove_folder_background(path, journal=journal)
+
+    def assemble_stage(path: str, patient_id: str) -> None:
+        with journal.stage(path, patient_id, ASSEMBLED, photos_fingerprint(path)):
+            commands.montar_template(patient_id, path, template, layout, fast_decode)
+
+    limiter = uploader.RateLimiter(secrets.get("upload_rate", 0))
+    retries = secrets.get("upload_retries", 2)
+
+    def upload_stage(path: str, patient_id: str) -> None:
+        result = uploader.upload_patient(
+            path, patient_id, limiter, retries, 1.0, journal
+        )
+        if not result.ok:
+            raise RuntimeError(result.error)
+
+    stages = [Stage("rename", rename_stage, workers["rename"])]
+    if remove_background:
+        stages.append(Stage("background", background_stage, workers["background"]))
+    stages.append(Stage("assemble", assemble_stage, workers["assemble"]))
+    if upload:
+        stages.append(Stage("upload", upload_stage, workers["upload"]))
+    return stages
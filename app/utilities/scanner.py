@@ -0,0 +1,82 @@
+"""
+This module implements listing many folders concurrently. On network shares every listing (or
+stat) is a round trip, so doing them from a bounded thread pool hides most of the latency. The
+time spent waiting on the file system is measured, to tell whether a slow scan comes from the
+share or from the app.
+"""
+
+import time
+import threading
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable
+from .my_secrets import get_secrets
+
+
+@dataclass
+class ScanStats:
+    """
+    Timings of a scan. io_seconds is the sum of the time spent inside file system calls (from
+    all threads), while seconds is the scan's wall time. action names what was done to the
+    folders in the report.
+    """
+
+    action: str = "Scanned"
+    workers: int = 1
+    folders: int = 0
+    io_seconds: float = 0.0
+    slowest: float = 0.0
+    seconds: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, seconds: float, folders: int = 1) -> None:
+        """
+        This function will record a file system call that took a given amount of seconds (and
+        checked a given amount of folders, e.g. 0 for listing the root folder).
+        """
+        with self._lock:
+            self.folders += folders
+            self.io_seconds += seconds
+            self.slowest = max(self.slowest, seconds)
+
+    def report(self) -> str:
+        """
+        A one line summary of this scan.
+        """
+        average = self.io_seconds / self.folders if self.folders > 0 else 0.0
+        return (
+            f"{self.action} {self.folders} folder(s) in {self.seconds:.2f}s with {self.workers} "
+            f"thread(s): file system {self.io_seconds:.2f}s in total, {average * 1000:.1f}ms "
+            f"on average, {self.slowest * 1000:.1f}ms at most."
+        )
+
+
+def scan_workers() -> int:
+    """
+    The amount of threads used for scanning ("scan_workers" in the secrets file).
+    """
+    return max(1, get_secrets().get("scan_workers", 8))
+
+
+def map_folders(
+    func: Callable, paths: Iterable, stats: ScanStats | None = None
+) -> list:
+    """
+    This function will call func for each path from a bounded thread pool and return the
+    results in the same order as paths. Each call is timed into stats (if given).
+    """
+    stats = stats if stats is not None else ScanStats()
+    stats.workers = scan_workers()
+
+    def timed(path):
+        start = time.perf_counter()
+        try:
+            return func(path)
+        finally:
+            stats.add(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=stats.workers) as executor:
+        results = list(executor.map(timed, paths))
+    stats.seconds += time.perf_counter() - start
+    return results
@@ -0,0 +1,112 @@
+"""
+This module implements the app's startup. The loading screen only needs tkinter and Pillow, so it
+shows up right away and everything else is loaded in steps (in a background thread) while it's
+up: the main window's modules first, then the heavy resources (the blank template, the fonts
+and rembg's model), which keep loading after the main window shows up. Steps are timed
+(imports included), so the loading screen shows real progress and the startup report tells how
+long each import/step and the first window took.
+"""
+
+import time
+import threading
+from dataclasses import dataclass
+from typing import Callable
+
+# Set when this module is first imported (main.py imports it before anything else).
+STARTED = time.perf_counter()
+
+
+@dataclass
+class Step:
+    """
+    Something loaded at startup. Required steps are the ones the main window needs: the loading
+    screen is up until they're done.
+    """
+
+    name: str
+    load: Callable[[], object]
+    required: bool = True
+    seconds: float = 0.0
+    error: str = ""
+    done: bool = False
+
+
+class WarmUp:
+    """
+    This class will run startup steps, in order, in a background thread and keep track of their
+    progress. Milestones (e.g. the first window showing up) are timed from STARTED.
+    """
+
+    def __init__(self, steps: list[Step]):
+        self.steps = steps
+        self.milestones: dict[str, float] = {}
+        self._current = ""
+        self._finished = threading.Event()
+
+    def start(self) -> "WarmUp":
+        """
+        This function will start running the steps (and return this warm-up).
+        """
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def _run(self) -> None:
+        for step in self.steps:
+            self._current = step.name
+            start = time.perf_counter()
+            try:
+                step.load()
+            except Exception as err:  # pylint: disable=broad-except
+                step.error = str(err) or type(err).__name__
+            step.seconds = time.perf_counter() - start
+            step.done = True
+        self._current = ""
+        self.mark("warm-up")
+        self._finished.set()
+
+    def mark(self, milestone: str) -> None:
+        """
+        This function will record how long it took (since startup) to reach a milestone.
+        """
+        self.milestones.setdefault(milestone, time.perf_counter() - STARTED)
+
+    def progress(self) -> tuple[int, int, str]:
+        """
+        The amount of steps done, the amount of steps and the step being loaded ("" if none).
+        """
+        done = sum(step.done for step in self.steps)
+        return done, len(self.steps), self._current
+
+    def ready(self) -> bool:
+        """
+        Whether the required steps are done.
+        """
+        return all(step.done for step in self.steps if step.required)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        This function will wait for every step to be done. It returns False on timeout.
+        """
+        return self._finished.wait(timeout)
+
+    def report(self) -> str:
+        """
+        A summary of the startup: each milestone (since startup) and each step's time.
+        """
+        lines = [
+            "Startup: "
+            + ", ".join(
+                f"{milestone} after {seconds:.2f}s"
+                for milestone, seconds in self.milestones.items()
+            )
+            + "."
+        ]
+        for step in self.steps:
+            if not step.done:
+                status = "not done"
+            elif step.error:
+                status = f"failed after {step.seconds:.2f}s ({step.error})"
+            else:
+                status = f"{step.seconds:.2f}s"
+            lines.append(f"  {step.name:<20} {status}")
+        return "\n".join(lines)
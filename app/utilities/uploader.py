@@ -0,0 +1,167 @@
+"""
+This module implements uploading templates for many patients concurrently. Uploads run in a
+bounded thread pool, optionally rate limited, and failed uploads are retried with exponential
+backoff. Every patient gets an UploadResult. Uploads are recorded in the journal, so templates
+that were already uploaded (and didn't change since) are skipped when a batch is run again.
+"""
+
+import os
+import time
+import threading
+from glob import glob
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable
+import requests  # type: ignore[import]
+from .my_secrets import get_secrets
+from .journal import UPLOADED, Journal, fingerprint
+from . import commands
+
+
+@dataclass
+class UploadResult:
+    """
+    What happened while uploading a patient's template.
+    """
+
+    path: str
+    patient_id: str
+    ok: bool = False
+    attempts: int = 0
+    seconds: float = 0.0
+    error: str = ""
+    skipped: bool = False
+
+
+class RateLimiter:
+    """
+    This class will space calls to wait (from any thread) so they happen at most rate times per
+    second. A rate of 0 (or less) means no limit.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        """
+        This function will block until the next call is allowed.
+        """
+        if self.interval == 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _is_retryable(err: requests.RequestException) -> bool:
+    # Failed GETs were already retried by the API's session.
+    if getattr(err.request, "method", None) != "PUT":
+        return False
+    if isinstance(err, requests.HTTPError):
+        # Other 4xx responses (e.g. 400, 401, 404) would fail again.
+        status = err.response.status_code if err.response is not None else 0
+        return status == 429 or status >= 500
+    return isinstance(err, (requests.ConnectionError, requests.Timeout))
+
+
+def upload_patient(
+    path: str,
+    patient_id: str,
+    limiter: RateLimiter,
+    retries: int,
+    backoff: float,
+    journal: Journal | None = None,
+    force: bool = False,
+) -> UploadResult:
+    """
+    This function will upload a patient's template, retrying failed uploads (PUTs that hit a
+    connection error, a timeout, 429 or 5xx) up to retries times (waiting backoff, 2 * backoff,
+    4 * backoff... seconds between attempts). Other 4xx responses fail right away and failed GETs
+    aren't retried here, the API's session already did (see api.get_session). Errors are also
+    written to the error log. If a journal is given, the result is recorded in it and (unless
+    force is set) a template that was already uploaded as is gets skipped.
+    """
+    result = UploadResult(path, patient_id)
+    template_fingerprint = fingerprint(glob(os.path.join(path, f"{patient_id}_*.jpg")))
+    if (
+        journal is not None
+        and not force
+        and journal.is_done(path, UPLOADED, template_fingerprint)
+    ):
+        result.ok = result.skipped = True
+        return result
+
+    start = time.perf_counter()
+    while True:
+        result.attempts += 1
+        limiter.wait()
+        try:
+            commands.upload_template(path, patient_id)
+        except requests.RequestException as err:
+            result.error = f"Erro no upload do template ({err})"
+            if _is_retryable(err) and result.attempts <= retries:
+                time.sleep(backoff * 2 ** (result.attempts - 1))
+                continue
+        except Exception as err:  # pylint: disable=broad-except
+            result.error = str(err) or type(err).__name__
+        else:
+            result.ok = True
+            result.error = ""
+        break
+
+    result.seconds = time.perf_counter() - start
+    if journal is not None:
+        journal.record(path, patient_id, UPLOADED, template_fingerprint, result.error)
+    if not result.ok:
+        try:
+            commands.salvar_info_erro(f"ID {patient_id}: {result.error}")
+        except Exception:  # pylint: disable=broad-except
+            # The result (and the journal) already have the error.
+            pass
+    return result
+
+
+def upload_templates(
+    paths_and_ids: list,
+    concurrency: int | None = None,
+    rate: float | None = None,
+    retries: int | None = None,
+    on_result: Callable[[UploadResult, int], None] | None = None,
+    force: bool = False,
+) -> list[UploadResult]:
+    """
+    This function will upload the templates of a list of (folder path, patient id) tuples, at
+    most concurrency at the same time and at most rate uploads per second. Concurrency, rate and
+    retries default to "upload_concurrency", "upload_rate" and "upload_retries" (secrets file).
+    on_result is called with each result (as soon as it is ready) and how many are done so far.
+    Results are returned in the same order as paths_and_ids. Templates already uploaded (per the
+    journal) are skipped unless force is set.
+    """
+    secrets = get_secrets()
+    if concurrency is None:
+        concurrency = secrets.get("upload_concurrency", 4)
+    if rate is None:
+        rate = secrets.get("upload_rate", 0)
+    if retries is None:
+        retries = secrets.get("upload_retries", 2)
+    limiter = RateLimiter(rate)
+    journal = Journal()
+
+    results: list = [None] * len(paths_and_ids)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = {
+            executor.submit(
+                upload_patient, path, patient_id, limiter, retries, 1.0, journal, force
+            ): i
+            for i, (path, patient_id) in enumerate(paths_and_ids)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            results[futures[future]] = result = future.result()
+            if on_result is not None:
+                on_result(result, done)
+    return results
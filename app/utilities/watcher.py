@@ -0,0 +1,210 @@
+"""
+This module implements watching the patients' root folder for changes. On Linux it uses inotify
+(through ctypes, no extra dependencies); everywhere else (or if inotify isn't available) it polls
+the modification times of root's patient folders (and of their "OBJETIVA" subfolders), which
+costs a listing of root and a stat per patient folder per interval. Changes are reported per
+patient folder (changes inside "OBJETIVA" are reported as its patient folder's), once they
+settle down (e.g. after all photos of a folder were copied).
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+from fnmatch import fnmatch
+from typing import Callable
+from .folder_index import PATIENT_FOLDER_PATTERN
+
+# inotify flags (see "man inotify").
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_IN_ONLYDIR = 0x01000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_FOLDER_MASK = _IN_CREATE | _IN_DELETE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CLOSE_WRITE
+_ROOT_MASK = _FOLDER_MASK | _IN_ONLYDIR | _IN_DELETE_SELF
+_EVENT = struct.Struct("iIII")
+# Subfolder of a patient folder with photos of its own (see commands.montar_template).
+_SUBFOLDER = "OBJETIVA"
+
+
+def _is_patient_folder(name: str) -> bool:
+    return not name.startswith(".") and fnmatch(name, PATIENT_FOLDER_PATTERN)
+
+
+def _mtime_ns(path: str) -> int | None:
+    try:
+        return os.stat(path).st_mtime_ns
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+class FolderWatcher(threading.Thread):
+    """
+    This thread will call on_change (from this thread) with a set of changed patient folder
+    paths whenever something changes in root's patient folders or in their "OBJETIVA" subfolders
+    (including folders being created or removed). Changes are only reported after settle seconds
+    without new changes. Use stop to stop watching.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        on_change: Callable[[set], None],
+        *,
+        settle: float = 2.0,
+        poll_interval: float = 2.0,
+        use_inotify: bool = True,
+    ):
+        super().__init__(daemon=True)
+        self.root = root
+        self.on_change = on_change
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify and sys.platform.startswith("linux")
+        self._stop_event = threading.Event()
+        self._pending: set = set()
+        self._last_change = 0.0
+
+    def stop(self) -> None:
+        """
+        This function will stop watching (the thread finishes shortly after).
+        """
+        self._stop_event.set()
+
+    def run(self) -> None:
+        if self.use_inotify:
+            try:
+                self._watch_inotify()
+                return
+            except OSError:
+                # e.g. too many watches: falling back to polling.
+                pass
+        self._watch_polling()
+
+    def _changed(self, paths) -> None:
+        paths = set(paths)
+        if paths:
+            self._pending.update(paths)
+            self._last_change = time.monotonic()
+
+    def _flush(self) -> None:
+        if self._pending and time.monotonic() - self._last_change >= self.settle:
+            paths, self._pending = self._pending, set()
+            self.on_change(paths)
+
+    def _snapshot(self) -> dict:
+        snapshot = {}
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if not _is_patient_folder(entry.name):
+                    continue
+                try:
+                    if entry.is_dir():
+                        snapshot[entry.path] = (
+                            entry.stat().st_mtime_ns,
+                            _mtime_ns(os.path.join(entry.path, _SUBFOLDER)),
+                        )
+                except FileNotFoundError:
+                    continue
+        return snapshot
+
+    def _watch_polling(self) -> None:
+        previous = self._snapshot()
+        while not self._stop_event.wait(min(self.poll_interval, self.settle)):
+            try:
+                current = self._snapshot()
+            except FileNotFoundError:
+                current = {}
+            self._changed(
+                path
+                for path in previous.keys() | current.keys()
+                if previous.get(path) != current.get(path)
+            )
+            previous = current
+            self._flush()
+
+    def _watch_inotify(self) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # Watch descriptor: (watched path, patient folder its changes are reported as).
+        watches: dict = {}
+
+        def add_watch(path: str, mask: int, folder: str | None = None) -> None:
+            wd = libc.inotify_add_watch(fd, os.fsencode(path), mask)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err in (errno.ENOENT, errno.ENOTDIR):
+                    return
+                raise OSError(err, f"inotify_add_watch failed for {path}")
+            watches[wd] = (path, folder or path)
+
+        def add_folder_watches(folder: str) -> None:
+            add_watch(folder, _FOLDER_MASK)
+            add_watch(os.path.join(folder, _SUBFOLDER), _FOLDER_MASK, folder)
+
+        try:
+            add_watch(self.root, _ROOT_MASK)
+            for path in self._snapshot():
+                add_folder_watches(path)
+
+            while not self._stop_event.is_set():
+                readable, _, _ = select.select([fd], [], [], 0.5)
+                if readable:
+                    self._read_events(fd, watches, add_watch, add_folder_watches)
+                self._flush()
+        finally:
+            os.close(fd)
+
+    def _read_events(
+        self, fd: int, watches: dict, add_watch: Callable, add_folder_watches: Callable
+    ) -> None:
+        try:
+            data = os.read(fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+
+            watched = watches.get(wd)
+            if mask & _IN_IGNORED:
+                watches.pop(wd, None)
+                continue
+            if watched is None:
+                continue
+            path, folder = watched
+            if path == self.root:
+                if not _is_patient_folder(name):
+                    continue
+                folder = os.path.join(self.root, name)
+                if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                    # Files added before the watch existed are still caught: the whole folder
+                    # is reported as changed.
+                    add_folder_watches(folder)
+                self._changed([folder])
+            else:
+                if (
+                    path == folder
+                    and name == _SUBFOLDER
+                    and mask & _IN_ISDIR
+                    and mask & (_IN_CREATE | _IN_MOVED_TO)
+                ):
+                    add_watch(os.path.join(path, name), _FOLDER_MASK, folder)
+                self._changed([folder])
@@ -0,0 +1,57 @@
+"""
+This module implements the app's shared process pool. Spawning processes is slow (specially on
+Windows, where every new process re-imports the app's modules), so a single pool is created on
+first use and reused until the app exits.
+"""
+
+import os
+import atexit
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from .my_secrets import get_secrets
+
+_POOL: ProcessPoolExecutor | None = None
+_POOL_LOCK = threading.Lock()
+
+
+def pool_size() -> int:
+    """
+    This function will return the configured amount of worker processes ("decode_workers" in the
+    secrets file). It defaults to the amount of CPUs.
+    """
+    workers = get_secrets().get("decode_workers")
+    if not workers or workers < 1:
+        return os.cpu_count() or 1
+    return int(workers)
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """
+    This function will return the shared process pool, creating it if needed. A broken pool (one
+    of its processes died, e.g. killed or out of memory) is replaced by a new one. It is safe to
+    call it from multiple threads.
+    """
+    global _POOL
+    with _POOL_LOCK:
+        # ProcessPoolExecutor has no public way of telling it's broken.
+        if _POOL is not None and getattr(_POOL, "_broken", False):
+            _POOL.shutdown(wait=False, cancel_futures=True)
+            _POOL = None
+        if _POOL is None:
+            _POOL = ProcessPoolExecutor(max_workers=pool_size())
+        return _POOL
+
+
+def shutdown_pool() -> None:
+    """
+    This function will shut the shared process pool down (if it exists). A new pool will be
+    created if get_pool is called afterwards.
+    """
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=True, cancel_futures=True)
+            _POOL = None
+
+
+atexit.register(shutdown_pool)
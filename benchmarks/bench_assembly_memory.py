@@ -0,0 +1,151 @@
+"""
+Benchmark: memory used by the app's process while assembling templates. It compares the previous
+approach (workers return int64 arrays, which are pickled back to the app's process) with the
+shared memory canvas (workers decode straight into a uint8 canvas).
+
+Usage (from the project's root folder):
+    python benchmarks/bench_assembly_memory.py [--patients N] [--photo-size 4000x3000]
+
+Each approach runs in its own process, so their peak RSS don't mix.
+"""
+
+import os
+import sys
+import time
+import json
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+from glob import glob
+import numpy as np
+from PIL import Image  # type: ignore[import]
+from skimage.io import imsave  # type: ignore[import]
+
+from samples import make_patient_folder  # pylint: disable=wrong-import-order
+
+from utilities import commands  # type: ignore[import]  # pylint: disable=wrong-import-order
+from utilities.layout import load_layout  # type: ignore[import]
+from utilities.workers import get_pool, shutdown_pool  # type: ignore[import]
+
+try:
+    import resource
+except ImportError:  # Windows.
+    resource = None  # type: ignore[assignment]
+
+
+def legacy_read_and_process_image(slot_path: tuple) -> np.ndarray:
+    """
+    The previous read_and_process_image: it returns an int64 copy of the resized photo.
+    """
+    slot, path = slot_path
+    img = Image.open(glob(os.path.join(path, f"{slot.position}*MG*[0-9]*.jpg"))[0])
+    return np.array(img.resize(slot.size)).astype(int)
+
+
+def legacy_assemble(path_pasta, template, layout, output_path) -> None:
+    """
+    The previous way of assembling a template (without the header).
+    """
+    canvas = template.copy()
+    images = list(
+        get_pool().map(
+            legacy_read_and_process_image, [(slot, path_pasta) for slot in layout.slots]
+        )
+    )
+    for slot, image in zip(layout.slots, images):
+        canvas[slot.region] = image
+    imsave(output_path, canvas)
+
+
+def shared_assemble(path_pasta, template, layout, output_path) -> None:
+    """
+    The current way of assembling a template (without the header).
+    """
+    commands.assemble_template(
+        path_pasta, template, layout, None, output_path, fast_decode=False
+    )
+
+
+def run(mode: str, folders: list) -> dict:
+    """
+    This function will assemble a template for each folder using a given approach and return its
+    timings and memory usage.
+    """
+    layout = load_layout("default")
+    width, height = layout.canvas
+    template = np.full((height, width, 3), 255, dtype=np.uint8)
+    assemble = legacy_assemble if mode == "legacy" else shared_assemble
+
+    # Warming the pool up, so spawning processes isn't measured.
+    get_pool().submit(int).result()
+    rss_before = _max_rss()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    for folder in folders:
+        assemble(folder, template, layout, os.path.join(folder, "template.jpg"))
+    elapsed = time.perf_counter() - start
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        "mode": mode,
+        "seconds_per_patient": elapsed / len(folders),
+        "traced_peak_mb": traced_peak / 2**20,
+        "max_rss_mb": _max_rss(),
+        "max_rss_growth_mb": _max_rss() - rss_before,
+    }
+    shutdown_pool()
+    return result
+
+
+def _max_rss() -> float:
+    if resource is None:
+        return float("nan")
+    # ru_maxrss is in KB on Linux and in bytes on macOS.
+    scale = 2**20 if sys.platform == "darwin" else 2**10
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def main() -> int:
+    """Main function."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--patients", type=int, default=3)
+    parser.add_argument("--photo-size", default="4000x3000")
+    parser.add_argument("--run", choices=["legacy", "shared"], help=argparse.SUPPRESS)
+    parser.add_argument("--folders", nargs="*", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run(args.run, args.folders)))
+        return 0
+
+    size = tuple(int(n) for n in args.photo_size.split("x"))
+    with tempfile.TemporaryDirectory() as tmp:
+        folders = [
+            make_patient_folder(os.path.join(tmp, str(1000 + i)), size=size)
+            for i in range(args.patients)
+        ]
+        print(
+            f"{'mode':<8} {'s/patient':>10} {'traced peak MB':>15} {'max RSS MB':>11} "
+            f"{'RSS growth MB':>14}"
+        )
+        for mode in ("legacy", "shared"):
+            output = subprocess.run(
+                [sys.executable, __file__, "--run", mode, "--folders", *folders],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            result = json.loads(output.splitlines()[-1])
+            print(
+                f"{mode:<8} {result['seconds_per_patient']:>10.2f} "
+                f"{result['traced_peak_mb']:>15.1f} {result['max_rss_mb']:>11.1f} "
+                f"{result['max_rss_growth_mb']:>14.1f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,79 @@
+"""
+Benchmark: decoding and resizing photos to their slot sizes, comparing the full decode with the
+fast (reduced resolution) decode. Quality is reported as the PSNR of the fast output against the
+full one (higher is better, above ~40 dB differences are hard to see).
+
+Usage (from the project's root folder):
+    python benchmarks/bench_decode.py [--folder PATIENT_FOLDER] [--photo-size 6000x4000]
+"""
+
+import os
+import time
+import argparse
+import tempfile
+from glob import glob
+import numpy as np
+
+from samples import make_patient_folder  # pylint: disable=wrong-import-order
+
+from utilities.commands import load_slot_image  # type: ignore[import]
+from utilities.layout import load_layout  # type: ignore[import]
+
+
+def psnr(reference: np.ndarray, other: np.ndarray) -> float:
+    """
+    Peak signal-to-noise ratio (in dB) between two uint8 images.
+    """
+    mse = np.mean((reference.astype(np.float64) - other) ** 2)
+    return float("inf") if mse == 0 else 10 * np.log10(255**2 / mse)
+
+
+def bench_folder(folder: str, repeat: int) -> None:
+    """
+    This function will time both decoding modes for each of a folder's photos.
+    """
+    layout = load_layout("default")
+    totals = {True: 0.0, False: 0.0}
+    print(f"{'photo':<24} {'full s':>8} {'fast s':>8} {'PSNR dB':>8}")
+    for slot in layout.slots:
+        path = glob(os.path.join(folder, f"{slot.position}*MG*[0-9]*.jpg"))[0]
+        outputs = {}
+        seconds = {}
+        for fast in (False, True):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                outputs[fast] = np.asarray(load_slot_image(path, slot.size, fast))
+            seconds[fast] = (time.perf_counter() - start) / repeat
+            totals[fast] += seconds[fast]
+        print(
+            f"{os.path.basename(path):<24} {seconds[False]:>8.3f} {seconds[True]:>8.3f} "
+            f"{psnr(outputs[False], outputs[True]):>8.1f}"
+        )
+    print(
+        f"{'total':<24} {totals[False]:>8.3f} {totals[True]:>8.3f} "
+        f"({totals[False] / totals[True]:.1f}x faster)"
+    )
+
+
+def main() -> int:
+    """Main function."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--folder", help="A patient folder (with renamed photos).")
+    parser.add_argument("--photo-size", default="6000x4000")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.folder:
+        bench_folder(args.folder, args.repeat)
+        return 0
+
+    size = tuple(int(n) for n in args.photo_size.split("x"))
+    with tempfile.TemporaryDirectory() as tmp:
+        bench_folder(
+            make_patient_folder(os.path.join(tmp, "1000"), size=size), args.repeat
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,103 @@
+"""
+Benchmark: encoding an assembled template with each JPEG encoder setting (quality, chroma
+subsampling, progressive, optimize). It reports the encoding time, the file size (what's uploaded)
+and the PSNR against the template's pixels (how much quality is lost) for each setting.
+
+Usage (from the project's root folder):
+    python benchmarks/bench_encoder.py [--repeat 3] [--quality 75 90 95]
+
+The template is the default layout's background with synthetic photos in its slots. skimage's
+imsave (what assembling used before) is measured too, if it's installed.
+"""
+
+import io
+import os
+import time
+import tempfile
+import argparse
+import itertools
+import numpy as np
+from PIL import Image  # type: ignore[import]
+
+from samples import make_photo  # pylint: disable=wrong-import-order
+
+from utilities import commands  # type: ignore[import]  # pylint: disable=wrong-import-order
+from utilities.encoder import JpegSettings, save_jpeg  # type: ignore[import]
+from utilities.layout import load_layout  # type: ignore[import]
+
+
+def make_template() -> np.ndarray:
+    """
+    This function will create an assembled template: the default layout's background with a
+    synthetic photo in each slot.
+    """
+    layout = load_layout("default")
+    canvas = np.array(commands.load_template(layout.background))
+    for slot in layout.slots:
+        canvas[slot.region] = np.asarray(make_photo(slot.size, slot.position))
+    return canvas
+
+
+def psnr(original: np.ndarray, encoded: bytes) -> float:
+    """
+    The peak signal to noise ratio (in dB) of an encoded image against its original pixels.
+    """
+    decoded = np.asarray(Image.open(io.BytesIO(encoded)).convert("RGB"))
+    error = np.mean((decoded.astype(np.float32) - original) ** 2)
+    return float(10 * np.log10(255**2 / error)) if error > 0 else float("inf")
+
+
+def measure(encode, path: str, repeat: int) -> tuple[float, bytes]:
+    """
+    This function will encode a template to path repeat times and return the fastest time and
+    the encoded bytes.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        encode(path)
+        best = min(best, time.perf_counter() - start)
+    with open(path, "rb") as file:
+        return best, file.read()
+
+
+def main() -> int:
+    """Main function."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--quality", type=int, nargs="+", default=[75, 85, 95])
+    args = parser.parse_args()
+
+    template = make_template()
+    print(f"Template: {template.shape[1]}x{template.shape[0]}")
+    print(f"{'setting':<32} {'encode s':>9} {'size KB':>9} {'PSNR dB':>8}")
+    encoders = []
+    try:
+        from skimage.io import imsave  # type: ignore[import]
+
+        encoders.append(("skimage imsave", lambda path: imsave(path, template)))
+    except ImportError:
+        pass
+    for quality, subsampling, progressive, optimize in itertools.product(
+        args.quality, ("4:2:0", "4:4:4"), (False, True), (False, True)
+    ):
+        settings = JpegSettings(quality, subsampling, progressive, optimize)
+        encoders.append(
+            (
+                settings.describe(),
+                lambda path, settings=settings: save_jpeg(template, path, settings),
+            )
+        )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, encode in encoders:
+            seconds, encoded = measure(encode, os.path.join(tmp, "t.jpg"), args.repeat)
+            print(
+                f"{name:<32} {seconds:>9.3f} {len(encoded) / 1024:>9.0f} "
+                f"{psnr(template, encoded):>8.2f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
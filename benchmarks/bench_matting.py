@@ -0,0 +1,110 @@
+"""
+Benchmark: alpha matting a portrait given its (coarse) mask, comparing the built-in band matting
+with rembg's matting (pymatting, whole image) when it's installed and with no matting at all. The
+synthetic portraits have a known alpha (soft, hair-like edges), so each result's error against
+it is reported along with its time.
+
+Usage (from the project's root folder):
+    python benchmarks/bench_matting.py [--photo-size 4000x3000] [--band-width 10] [--iterations 2]
+"""
+
+import time
+import argparse
+import numpy as np
+from PIL import Image, ImageFilter  # type: ignore[import]
+
+from samples import make_photo  # pylint: disable=wrong-import-order
+
+from utilities import masks  # type: ignore[import]
+
+
+def make_portrait(
+    size: tuple[int, int], seed: int = 0
+) -> tuple[Image.Image, np.ndarray, np.ndarray]:
+    """
+    This function will create a synthetic portrait with a soft edged subject (and thin strands
+    around it) over a textured background. It returns the portrait, its true alpha and a coarse
+    mask like the model's (computed at 320x320 and resized back).
+    """
+    width, height = size
+    y, x = np.ogrid[:height, :width]
+    head = ((x - width / 2) / (width / 6)) ** 2 + (
+        (y - height * 0.45) / (height / 3.5)
+    ) ** 2
+    angle = np.arctan2(y - height * 0.45, x - width / 2)
+    # Strands: the edge's radius wobbles quickly with the angle.
+    edge = 1 + 0.04 * np.sin(angle * 90 + seed)
+    subject = Image.fromarray(np.where(head <= edge**2, 255, 0).astype(np.uint8))
+    true_alpha = np.asarray(
+        subject.filter(ImageFilter.GaussianBlur(radius=max(1, width // 800)))
+    )
+
+    foreground = np.asarray(make_photo(size, seed), dtype=np.float32) * 0.5
+    background = np.asarray(make_photo(size, seed + 7), dtype=np.float32) * 0.3 + 160
+    weight = true_alpha[..., None].astype(np.float32) / 255
+    portrait = foreground * weight + background * (1 - weight)
+
+    coarse = Image.fromarray(true_alpha).resize((320, 320), Image.Resampling.LANCZOS)
+    coarse_mask = np.asarray(coarse.resize(size, Image.Resampling.LANCZOS))
+    return Image.fromarray(portrait.astype(np.uint8)), true_alpha, coarse_mask
+
+
+def rembg_matting(image: Image.Image, mask: np.ndarray) -> np.ndarray | None:
+    """
+    rembg's matting of image (None if rembg isn't installed).
+    """
+    try:
+        from rembg import bg  # type: ignore[import]
+    except ImportError:
+        return None
+    cutout = bg.alpha_matting_cutout(image, Image.fromarray(mask), 240, 10, 10)
+    return np.asarray(cutout)[..., 3]
+
+
+def errors(alpha: np.ndarray, true_alpha: np.ndarray) -> tuple[float, float]:
+    """
+    The mean absolute error (in alpha levels) over the whole image and over the true alpha's
+    soft edge only.
+    """
+    difference = np.abs(alpha.astype(np.int16) - true_alpha)
+    edge = (true_alpha > 0) & (true_alpha < 255)
+    return float(difference.mean()), float(difference[edge].mean())
+
+
+def main() -> int:
+    """Main function."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--photo-size", default="4000x3000")
+    parser.add_argument("--count", type=int, default=2)
+    parser.add_argument("--band-width", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=2)
+    args = parser.parse_args()
+    size = tuple(int(n) for n in args.photo_size.split("x"))
+
+    print(
+        f"{'photo':<6} {'method':<8} {'seconds':>8} {'mean error':>11} {'edge error':>11}"
+    )
+    for seed in range(args.count):
+        image, true_alpha, mask = make_portrait(size, seed)
+        results = {"none": (0.0, mask)}
+
+        start = time.perf_counter()
+        _, alpha = masks.band_matting(
+            image, mask, args.band_width, iterations=args.iterations
+        )
+        results["band"] = (time.perf_counter() - start, alpha)
+
+        start = time.perf_counter()
+        if (alpha := rembg_matting(image, mask)) is not None:
+            results["rembg"] = (time.perf_counter() - start, alpha)
+
+        for method, (seconds, alpha) in results.items():
+            mean, edge = errors(alpha, true_alpha)
+            print(
+                f"{seed + 1:<6} {method:<8} {seconds:>8.3f} {mean:>11.3f} {edge:>11.2f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,194 @@
+"""
+Benchmark: time and memory spent around the model when removing a photo's background, comparing
+the previous path (rembg's transparent PNG is encoded, decoded again and pasted over a white
+image) with the in-memory one (the alpha is blended over white with numpy). The model's inference
+is the same in both paths, so it's replaced by a synthetic soft-edged mask (no need for rembg).
+
+Usage (from the project's root folder):
+    python benchmarks/bench_rm_bg.py [--photo-size 4000x3000] [--repeat 3]
+
+Each path runs in its own process, so their peak RSS don't mix. Pillow's allocations aren't
+traced by tracemalloc (numpy's are), so the RSS growth is the figure to compare.
+"""
+
+import io
+import os
+import sys
+import time
+import json
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+import numpy as np
+from PIL import Image, ImageFilter  # type: ignore[import]
+
+from samples import make_photo  # pylint: disable=wrong-import-order
+
+from utilities.im_bg import FILL_COLOR, composite  # type: ignore[import]
+
+try:
+    import resource
+except ImportError:  # Windows.
+    resource = None  # type: ignore[assignment]
+
+
+def make_mask(size: tuple[int, int]) -> Image.Image:
+    """
+    This function will create a blurred ellipse ("L" mode), like a segmented face.
+    """
+    width, height = size
+    y, x = np.ogrid[:height, :width]
+    inside = ((x - width / 2) / (width / 3)) ** 2 + (
+        (y - height / 2) / (height / 2.5)
+    ) ** 2
+    mask = Image.fromarray(np.where(inside <= 1, 255, 0).astype(np.uint8))
+    return mask.filter(ImageFilter.GaussianBlur(radius=max(1, width // 200)))
+
+
+def legacy_rm_bg(jpeg: bytes, mask: Image.Image) -> np.ndarray:
+    """
+    The previous path: rembg made a transparent cutout and returned it as PNG bytes, which were
+    decoded, converted to RGBA and pasted over a white image.
+    """
+    image = Image.open(io.BytesIO(jpeg)).convert("RGB")
+    cutout = Image.composite(
+        image.convert("RGBA"), Image.new("RGBA", image.size, 0), mask
+    )
+    output_as_bytes = io.BytesIO()
+    cutout.save(output_as_bytes, "PNG")
+
+    pil_img = Image.open(io.BytesIO(output_as_bytes.getvalue())).convert("RGBA")
+    background = Image.new("RGB", pil_img.size, FILL_COLOR)
+    background.paste(pil_img, pil_img.split()[-1])
+    return np.asarray(background.convert("RGB"))
+
+
+def current_rm_bg(jpeg: bytes, mask: Image.Image) -> np.ndarray:
+    """
+    The current path: the photo and its alpha are blended over white in a single pass.
+    """
+    image = Image.open(io.BytesIO(jpeg)).convert("RGB")
+    return composite(np.asarray(image), np.asarray(mask))
+
+
+def run(mode: str, photo_path: str, mask_path: str, repeat: int) -> dict:
+    """
+    This function will remove a photo's background repeat times (using a mask instead of the
+    model) with a given path and return its timings and memory usage.
+    """
+    with open(photo_path, "rb") as photo:
+        jpeg_bytes = photo.read()
+    mask = Image.open(mask_path)
+    mask.load()
+    rm_bg = legacy_rm_bg if mode == "legacy" else current_rm_bg
+    rss_before = _max_rss()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        output = rm_bg(jpeg_bytes, mask)
+    elapsed = time.perf_counter() - start
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "mode": mode,
+        "seconds_per_image": elapsed / repeat,
+        "traced_peak_mb": traced_peak / 2**20,
+        "max_rss_growth_mb": _max_rss() - rss_before,
+        "shape": output.shape,
+    }
+
+
+def _max_rss() -> float:
+    if resource is None:
+        return float("nan")
+    # ru_maxrss is in KB on Linux and in bytes on macOS.
+    scale = 2**20 if sys.platform == "darwin" else 2**10
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def main() -> int:
+    """Main function."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--photo-size", default="4000x3000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--run", choices=["legacy", "current"], help=argparse.SUPPRESS)
+    parser.add_argument("--files", nargs=2, help=argparse.SUPPRESS)
+    parser.add_argument("--make", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.make:
+        size = tuple(int(n) for n in args.photo_size.split("x"))
+        make_photo(size).save(args.make[0], quality=90)
+        make_mask(size).save(args.make[1])
+        return 0
+
+    if args.run:
+        print(json.dumps(run(args.run, *args.files, args.repeat)))
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        photo_path = os.path.join(tmp, "1_IMG_0001.jpg")
+        mask_path = os.path.join(tmp, "mask.png")
+        # Peak RSS is inherited by child processes, so big arrays are only made in children.
+        subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "--photo-size",
+                args.photo_size,
+                "--make",
+                photo_path,
+                mask_path,
+            ],
+            check=True,
+        )
+
+        print(
+            f"{'mode':<8} {'s/image':>8} {'traced peak MB':>15} {'RSS growth MB':>14}"
+        )
+        for mode in ("legacy", "current"):
+            output = subprocess.run(
+                [
+                    sys.executable,
+                    __file__,
+                    "--run",
+                    mode,
+                    "--repeat",
+                    str(args.repeat),
+                    "--files",
+                    photo_path,
+                    mask_path,
+                ],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            result = json.loads(output.splitlines()[-1])
+            print(
+                f"{mode:<8} {result['seconds_per_image']:>8.3f} "
+                f"{result['traced_peak_mb']:>15.1f} {result['max_rss_growth_mb']:>14.1f}"
+            )
+
+        with open(photo_path, "rb") as photo:
+            jpeg_bytes = photo.read()
+        mask = Image.open(mask_path)
+        difference = np.abs(
+            legacy_rm_bg(jpeg_bytes, mask).astype(np.int16)
+            - current_rm_bg(jpeg_bytes, mask)
+        )
+        # The previous cutout was blended over black before being pasted over white, which
+        # darkened semi-transparent pixels (the blend happens once now).
+        print(
+            f"Pixel difference between both paths: {difference.max()} at most, "
+            f"{difference.mean():.3f} on average, "
+            f"{np.count_nonzero(difference.max(axis=-1) > 1) / difference[..., 0].size:.2%} "
+            "of pixels above 1."
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,150 @@
+"""
+Benchmark: segmenting photos at full resolution (current mode) versus the fast mode (the model
+gets a reduced copy and only the mask's boundary is refined at full resolution). It reports the
+time per photo and how much the fast masks differ from the full resolution ones.
+
+Usage (from the project's root folder):
+    python benchmarks/bench_segmentation.py [--photo-size 4000x3000] [--fast-size 1024]
+    python benchmarks/bench_segmentation.py --rembg [--matting] [PHOTO ...]
+
+Without --rembg, the model is replaced by a stand-in that resizes its input to 320x320 and back
+(as rembg does around U²-Net) and thresholds the synthetic portrait's background color, so only
+the work around the model is compared. With --matting, the current mode also runs rembg's alpha
+matting (which the fast mode replaces with its boundary refinement).
+"""
+
+import time
+import argparse
+import numpy as np
+from PIL import Image  # type: ignore[import]
+
+from samples import make_photo  # pylint: disable=wrong-import-order
+
+from utilities import masks  # type: ignore[import]
+from utilities.im_processing import downscale  # type: ignore[import]
+
+BACKGROUND = np.array([235, 235, 230], dtype=np.float32)
+
+
+def make_portrait(size: tuple[int, int], seed: int = 0) -> Image.Image:
+    """
+    This function will create a synthetic portrait: a textured head and shoulders over a flat
+    background.
+    """
+    width, height = size
+    y, x = np.ogrid[:height, :width]
+    head = ((x - width / 2) / (width / 7)) ** 2 + (
+        (y - height * 0.4) / (height / 4)
+    ) ** 2
+    shoulders = ((x - width / 2) / (width / 2.6)) ** 2 + (
+        (y - height * 1.05) / (height / 2.4)
+    ) ** 2
+    subject = (head <= 1) | (shoulders <= 1)
+    pixels = np.where(
+        subject[..., None],
+        np.asarray(make_photo(size, seed), dtype=np.float32) * 0.6,
+        BACKGROUND,
+    )
+    return Image.fromarray(pixels.astype(np.uint8))
+
+
+def stand_in_model(image: Image.Image) -> np.ndarray:
+    """
+    A model stand-in with rembg's resizing: 320x320 in, mask resized back to image's size.
+    """
+    small = np.asarray(
+        image.convert("RGB").resize((320, 320), Image.Resampling.LANCZOS),
+        dtype=np.float32,
+    )
+    distance = np.abs(small - BACKGROUND).sum(axis=-1)
+    probability = np.clip((distance - 20) / 40, 0, 1)
+    mask = Image.fromarray((probability * 255).astype(np.uint8))
+    return np.asarray(mask.resize(image.size, Image.Resampling.LANCZOS))
+
+
+def rembg_model(image: Image.Image) -> np.ndarray:
+    """
+    rembg's mask of image, with the app's model.
+    """
+    from utilities import bg_model  # type: ignore[import]
+
+    # pylint: disable=protected-access
+    return bg_model._infer(image, bg_model.default_model())
+
+
+def rembg_matting(image: Image.Image) -> np.ndarray:
+    """
+    rembg's alpha matted mask of image, with the app's model.
+    """
+    from utilities.im_bg import foreground_and_alpha  # type: ignore[import]
+
+    return foreground_and_alpha(image, alpha_matting=True, fast=False)[1]
+
+
+def compare(full: np.ndarray, fast: np.ndarray) -> tuple[float, float, float]:
+    """
+    This function will return the mean absolute difference (in alpha levels), the share of
+    pixels differing by more than 32 levels and the IoU of both masks (thresholded at 128).
+    """
+    difference = np.abs(full.astype(np.int16) - fast)
+    full_fg, fast_fg = full >= 128, fast >= 128
+    union = np.count_nonzero(full_fg | fast_fg)
+    iou = np.count_nonzero(full_fg & fast_fg) / union if union > 0 else 1.0
+    return float(difference.mean()), float(np.mean(difference > 32)), iou
+
+
+def main() -> int:
+    """Main function."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "photos", nargs="*", help="Photos (synthetic portraits by default)."
+    )
+    parser.add_argument("--photo-size", default="4000x3000")
+    parser.add_argument("--fast-size", type=int, default=1024)
+    parser.add_argument("--count", type=int, default=3)
+    parser.add_argument("--rembg", action="store_true", help="Use rembg's model.")
+    parser.add_argument(
+        "--matting", action="store_true", help="Alpha matting in the current mode."
+    )
+    args = parser.parse_args()
+
+    model = rembg_model if args.rembg else stand_in_model
+    current = rembg_matting if args.rembg and args.matting else model
+    if args.photos:
+        images = [Image.open(path).convert("RGB") for path in args.photos]
+    else:
+        size = tuple(int(n) for n in args.photo_size.split("x"))
+        images = [make_portrait(size, seed) for seed in range(args.count)]
+    if args.rembg:
+        # Loading the model isn't part of the comparison.
+        model(downscale(images[0], 320))
+
+    print(
+        f"{'photo':<6} {'full s':>7} {'fast s':>7} {'mean diff':>10} {'> 32':>7} {'IoU':>7}"
+    )
+    totals = [0.0, 0.0]
+    for number, image in enumerate(images, start=1):
+        start = time.perf_counter()
+        full = current(image)
+        full_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        fast = masks.upsample_and_refine(image, model(downscale(image, args.fast_size)))
+        fast_seconds = time.perf_counter() - start
+
+        totals[0] += full_seconds
+        totals[1] += fast_seconds
+        mean, above, iou = compare(full, fast)
+        print(
+            f"{number:<6} {full_seconds:>7.3f} {fast_seconds:>7.3f} {mean:>10.3f} "
+            f"{above:>7.3%} {iou:>7.4f}"
+        )
+    print(
+        f"{'total':<6} {totals[0]:>7.3f} {totals[1]:>7.3f} "
+        f"({totals[0] / totals[1]:.1f}x faster)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,45 @@
+"""
+Helpers shared by the benchmarks: making the app's modules importable and creating synthetic
+patient folders (so the benchmarks can run without real patient photos).
+"""
+
+import os
+import sys
+import numpy as np
+from PIL import Image  # type: ignore[import]
+
+APP_DIR = os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "app"))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+
+def make_photo(size: tuple[int, int], seed: int = 0) -> Image.Image:
+    """
+    This function will create a camera-like (smooth with some noise) RGB photo of a given
+    (width, height) size.
+    """
+    width, height = size
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 1, width, dtype=np.float32)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    channels = [
+        np.sin((x * (3 + c) + y * (2 + seed % 5)) * np.pi) * 100 + 128 for c in range(3)
+    ]
+    pixels = np.stack(channels, axis=-1)
+    pixels += rng.normal(0, 8, (1, width, 1)).astype(np.float32)
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def make_patient_folder(
+    folder: str, photos: int = 8, size: tuple[int, int] = (4000, 3000)
+) -> str:
+    """
+    This function will create a patient folder with already renamed photos (e.g.
+    "1_IMG_0001.jpg"). Existing photos are kept. It returns the folder's path.
+    """
+    os.makedirs(folder, exist_ok=True)
+    for position in range(1, photos + 1):
+        path = os.path.join(folder, f"{position}_IMG_{position:04d}.jpg")
+        if not os.path.exists(path):
+            make_photo(size, position).save(path, quality=90)
+    return folder